@@ -0,0 +1,41 @@
+
+class BaseBackend(object):
+
+    def get_key(self, name):
+        """
+        Get the key of a cache in the backend
+        :param name:    Name of the cache
+        :return:        Key
+        """
+
+        return '%s.cache.tar' % name
+
+    def exists(self, name):
+        """
+        Check if a cache exists in the backend
+        :param name:    Name of the cache
+        :return:        Exists
+        """
+
+        raise NotImplementedError()
+
+    def download(self, name, path):
+        """
+        Download a cache from the backend
+        :param name:    Name of the cache
+        :param path:    Path to download to
+        :return:        Checksum of the cache
+        """
+
+        raise NotImplementedError()
+
+    def upload(self, name, path, checksum):
+        """
+        Upload a cache to the backend
+        :param name:        Name of the cache
+        :param path:        Path to upload
+        :param checksum:    Checksum of the cache
+        :return:            void
+        """
+
+        raise NotImplementedError()
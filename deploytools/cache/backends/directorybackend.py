@@ -0,0 +1,85 @@
+
+from deploytools.cache.backends.basebackend import BaseBackend
+import os
+import shutil
+import tempfile
+
+
+class DirectoryBackend(BaseBackend):
+
+    def __init__(self, directory):
+        """
+        Construct
+        :param directory:   Directory to keep the caches in, like a shared mount
+        """
+
+        self.directory = directory
+
+    def exists(self, name):
+        """
+        Check if a cache exists in the backend
+        :param name:    Name of the cache
+        :return:        Exists
+        """
+
+        path = os.path.join(self.directory, self.get_key(name))
+        return os.path.isfile(path) and os.path.isfile('%s.sha256' % path)
+
+    def download(self, name, path):
+        """
+        Download a cache from the backend
+        :param name:    Name of the cache
+        :param path:    Path to download to
+        :return:        Checksum of the cache
+        """
+
+        source_path = os.path.join(self.directory, self.get_key(name))
+
+        # A cache that is replaced meanwhile won't match its checksum when committing locally
+        checksum_file = open('%s.sha256' % source_path)
+        source_file = open(source_path, 'rb')
+        try:
+            checksum = checksum_file.read().strip()
+            target_file = open(path, 'wb')
+            try:
+                shutil.copyfileobj(source_file, target_file, 1024 * 1024)
+            finally:
+                target_file.close()
+        finally:
+            source_file.close()
+            checksum_file.close()
+
+        return checksum
+
+    def upload(self, name, path, checksum):
+        """
+        Upload a cache to the backend
+        :param name:        Name of the cache
+        :param path:        Path to upload
+        :param checksum:    Checksum of the cache
+        :return:            void
+        """
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        target_path = os.path.join(self.directory, self.get_key(name))
+
+        # Write to temporary files next to the target, so the renames are atomic
+        handle, temp_path = tempfile.mkstemp(prefix='.%s.' % self.get_key(name), suffix='.tmp', dir=self.directory)
+        os.close(handle)
+        temp_checksum_path = '%s.sha256' % temp_path
+        try:
+            shutil.copyfile(path, temp_path)
+            checksum_file = open(temp_checksum_path, 'w')
+            try:
+                checksum_file.write(checksum)
+            finally:
+                checksum_file.close()
+
+            os.rename(temp_path, target_path)
+            os.rename(temp_checksum_path, '%s.sha256' % target_path)
+        finally:
+            for temp in (temp_path, temp_checksum_path):
+                if os.path.isfile(temp):
+                    os.remove(temp)
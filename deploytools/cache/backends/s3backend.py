@@ -0,0 +1,87 @@
+
+from deploytools.cache.backends.basebackend import BaseBackend
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+import boto3
+
+
+class S3Backend(BaseBackend):
+
+    def __init__(self, bucket, prefix='', endpoint=None, region=None, access_key=None, secret_key=None, concurrency=10, chunk_size=8):
+        """
+        Construct
+        :param bucket:      The bucket
+        :param prefix:      Prefix of the keys
+        :param endpoint:    Endpoint of an S3-compatible object store, like MinIO
+        :param region:      The region
+        :param access_key:  Access key, defaults to the environment
+        :param secret_key:  Secret key, defaults to the environment
+        :param concurrency: Parts to transfer in parallel
+        :param chunk_size:  Size of the parts in MB
+        """
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = boto3.client('s3', endpoint_url=endpoint, region_name=region,
+                                    aws_access_key_id=access_key, aws_secret_access_key=secret_key)
+        self._transfer_config = TransferConfig(multipart_threshold=chunk_size * 1024 * 1024,
+                                               multipart_chunksize=chunk_size * 1024 * 1024,
+                                               max_concurrency=concurrency,
+                                               use_threads=True)
+
+    def get_key(self, name):
+        """
+        Get the key of a cache in the backend
+        :param name:    Name of the cache
+        :return:        Key
+        """
+
+        return '%s%s' % (self.prefix, super(S3Backend, self).get_key(name))
+
+    def exists(self, name):
+        """
+        Check if a cache exists in the backend
+        :param name:    Name of the cache
+        :return:        Exists
+        """
+
+        try:
+            head = self._client.head_object(Bucket=self.bucket, Key=self.get_key(name))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return False
+            raise
+
+        # Without a checksum it can't be validated
+        return 'sha256' in head['Metadata']
+
+    def download(self, name, path):
+        """
+        Download a cache from the backend
+        :param name:    Name of the cache
+        :param path:    Path to download to
+        :return:        Checksum of the cache
+        """
+
+        key = self.get_key(name)
+
+        # A cache that is replaced meanwhile won't match its checksum when committing locally
+        head = self._client.head_object(Bucket=self.bucket, Key=key)
+        if 'sha256' not in head['Metadata']:
+            raise RuntimeError('Remote cache \'%s\' has no checksum' % key)
+        self._client.download_file(self.bucket, key, path, Config=self._transfer_config)
+
+        return head['Metadata']['sha256']
+
+    def upload(self, name, path, checksum):
+        """
+        Upload a cache to the backend
+        :param name:        Name of the cache
+        :param path:        Path to upload
+        :param checksum:    Checksum of the cache
+        :return:            void
+        """
+
+        extra_args = {'Metadata': {'sha256': checksum}}
+
+        self._client.upload_file(path, self.bucket, self.get_key(name), ExtraArgs=extra_args, Config=self._transfer_config)
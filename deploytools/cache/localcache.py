@@ -0,0 +1,214 @@
+
+from contextlib import contextmanager
+import errno
+import fcntl
+import hashlib
+import os
+import tempfile
+
+
+class LocalCache(object):
+
+    def __init__(self, directory):
+        """
+        Construct
+        :param directory:   Directory to keep the caches in
+        """
+
+        self.directory = directory
+
+    def get_path(self, name):
+        """
+        Get the path of a cache
+        :param name:    Name of the cache
+        :return:        Path
+        """
+
+        return os.path.join(self.directory, '%s.cache.tar' % name)
+
+    def exists(self, name):
+        """
+        Check if a cache exists
+        :param name:    Name of the cache
+        :return:        Exists
+        """
+
+        path = self.get_path(name)
+        return os.path.isfile(path) and os.path.isfile(self._get_checksum_path(path))
+
+    @contextmanager
+    def lock(self, name, shared=False, blocking=True):
+        """
+        Lock a cache. Readers share the lock, writers get it exclusively.
+        :param name:        Name of the cache
+        :param shared:      Shared lock
+        :param blocking:    Wait for the lock, instead of giving up when it's taken
+        :return:            Locked
+        """
+
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            operation |= fcntl.LOCK_NB
+
+        lock_file = open(os.path.join(self.directory, '%s.cache.lock' % name), 'a')
+        try:
+            try:
+                fcntl.flock(lock_file, operation)
+            except (IOError, OSError) as e:
+                if blocking or e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+                yield False
+                return
+
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            lock_file.close()
+
+    def get_names(self, prefix):
+        """
+        Get the names of the caches starting with a prefix, most recently used first
+        :param prefix:  Prefix of the names
+        :return:        List of names
+        """
+
+        used_at = dict()
+        for filename in os.listdir(self.directory):
+            if not filename.startswith(prefix) or not filename.endswith('.cache.tar'):
+                continue
+            name = filename[:-len('.cache.tar')]
+            try:
+                used_at[name] = os.path.getmtime(self.get_path(name))
+            except OSError:
+                # Removed meanwhile
+                continue
+
+        return sorted(used_at, key=lambda name: used_at[name], reverse=True)
+
+    def touch(self, name):
+        """
+        Mark a cache as used
+        :param name:    Name of the cache
+        :return:        void
+        """
+
+        os.utime(self.get_path(name), None)
+
+    def remove(self, name):
+        """
+        Remove a cache. Hold the lock while removing.
+        :param name:    Name of the cache
+        :return:        void
+        """
+
+        path = self.get_path(name)
+        for remove_path in (path, self._get_checksum_path(path)):
+            if os.path.isfile(remove_path):
+                os.remove(remove_path)
+
+    def get_checksum(self, name):
+        """
+        Get the stored checksum of a cache. Hold the lock while getting it.
+        :param name:    Name of the cache
+        :return:        Checksum
+        """
+
+        checksum_file = open(self._get_checksum_path(self.get_path(name)))
+        try:
+            return checksum_file.read().strip()
+        finally:
+            checksum_file.close()
+
+    def validate(self, name):
+        """
+        Validate the checksum of a cache. Hold the lock while validating.
+        :param name:    Name of the cache
+        :return:        void
+        """
+
+        path = self.get_path(name)
+
+        if self._get_checksum(path) != self.get_checksum(name):
+            raise RuntimeError('Checksum of \'%s\' does not match' % path)
+
+    def create(self, name):
+        """
+        Create a temporary file to write a new version of a cache to
+        :param name:    Name of the cache
+        :return:        Path
+        """
+
+        # Same directory, so the rename on commit is atomic
+        handle, path = tempfile.mkstemp(prefix='.%s.cache.' % name, suffix='.tmp', dir=self.directory)
+        os.close(handle)
+
+        return path
+
+    def commit(self, name, temp_path, expected_checksum=None):
+        """
+        Atomically replace a cache with a temporary file from create
+        :param name:                Name of the cache
+        :param temp_path:           The temporary file
+        :param expected_checksum:   Checksum the temporary file should have
+        :return:                    void
+        """
+
+        path = self.get_path(name)
+        checksum_path = self._get_checksum_path(path)
+        temp_checksum_path = self._get_checksum_path(temp_path)
+
+        try:
+            checksum = self._get_checksum(temp_path)
+            if expected_checksum is not None and checksum != expected_checksum:
+                raise RuntimeError('Checksum of \'%s\' does not match' % path)
+
+            checksum_file = open(temp_checksum_path, 'w')
+            try:
+                checksum_file.write(checksum)
+            finally:
+                checksum_file.close()
+
+            with self.lock(name):
+                os.rename(temp_path, path)
+                os.rename(temp_checksum_path, checksum_path)
+        finally:
+            self.discard(temp_path)
+
+    def discard(self, temp_path):
+        """
+        Remove a temporary file from create
+        :param temp_path:   The temporary file
+        :return:            void
+        """
+
+        for path in (temp_path, self._get_checksum_path(temp_path)):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def _get_checksum_path(self, path):
+        """
+        Get the path of the checksum of a file
+        :param path:    Path of the file
+        :return:        Path
+        """
+
+        return '%s.sha256' % path
+
+    def _get_checksum(self, path):
+        """
+        Calculate the checksum of a file
+        :param path:    Path of the file
+        :return:        Checksum
+        """
+
+        checksum = hashlib.sha256()
+        cache_file = open(path, 'rb')
+        try:
+            for chunk in iter(lambda: cache_file.read(1024 * 1024), b''):
+                checksum.update(chunk)
+        finally:
+            cache_file.close()
+
+        return checksum.hexdigest()
@@ -2,10 +2,24 @@
 from scriptcore.cuiscript import CuiScript
 from scriptcore.integrations.slack.slack import Slack
 from deploytools.models.user import User
+from deploytools.models.deployrun import DeployRun
+from deploytools.history.deployhistory import DeployHistory
+from deploytools.cache.localcache import LocalCache
+from deploytools.cache.backends.directorybackend import DirectoryBackend
+from datetime import datetime
+import binascii
+import copy
+import fcntl
+import hashlib
+import json
 import tempfile
 import os
 import yaml
 import shutil
+import signal
+import sqlite3
+import subprocess
+import time
 
 
 class BaseDriver(CuiScript):
@@ -30,6 +44,22 @@ class BaseDriver(CuiScript):
         self._temp_dirs = []
         self._deploy_stage = None
         self._slack_integration = None
+        self._deploy_history = None
+        self._deploy_run = None
+        self._cache = LocalCache('.')
+        self._cache_backend = None
+        self._cache_checksums = dict()
+        self._composer_cache_keep = 5
+        self._pending_uploads = []
+        self._checkpoint = None
+        self._checkpoint_directory = None
+        self._checkpoint_lock = None
+        self._cache_namespace = None
+        self._notifications_enabled = True
+        self._status_file = None
+        self._status = dict()
+        self._network_config = dict()
+        self._processes = []
 
     def _get_temp_dir(self):
         """
@@ -52,7 +82,7 @@ class BaseDriver(CuiScript):
             shutil.rmtree(temp_dir)
         self._temp_dirs = []
 
-    def _deploy_confirm(self, environment, warnings=None):
+    def _deploy_confirm(self, environment, warnings=None, ask=True):
 
         user = self._get_current_user()
         self.output.title('Beginning %s deploy sequence by %s' % (environment, user.name))
@@ -63,14 +93,14 @@ class BaseDriver(CuiScript):
                 self.output.warning(warning)
             self.output('')
 
-        if not self.input.yes_no('Do you really wish to deploy this application?'):
+        if ask and not self.input.yes_no('Do you really wish to deploy this application?'):
             self.output.error('Deploy aborted')
             return False
 
         self.output.success('Let\'s do this!')
         return True
 
-    def _git_clone(self, environment, directory, repo, branch, caching=True):
+    def _git_clone(self, environment, directory, repo, branch, caching=True, lfs=False):
         """
         Clone repository
         :param environment: The environment
@@ -78,82 +108,103 @@ class BaseDriver(CuiScript):
         :param repo:        The link to the repo
         :param branch:      The branch to checkout
         :param caching:     Caching
+        :param lfs:         Leave git lfs files as pointers, for _git_lfs_pull
         :return:            Success
         """
 
-        # Cache exists
-        cache_exists = os.path.isfile('./git.cache.tar')
+        # Keep git lfs from downloading all objects into the clone and its cache
+        git_env = 'GIT_LFS_SKIP_SMUDGE=1 ' if lfs else ''
 
         # Extract cache
-        if caching and cache_exists:
-            command = 'tar xf ./git.cache.tar -C "%s"' % directory
-            description = 'Extracting cached git repository'
-            out, err, exitcode = self.execute.spinner(command, description)
-            if exitcode != 0:
-                self.output.error('Failed extracting cached git repository\n%s' % '\n'.join(err))
+        cache_exists = False
+        if caching:
+            cache_exists = self._extract_cache(self._get_cache_name('git'), directory, 'git repository')
+            if cache_exists is None:
                 return False
+            self._record_cache('git', cache_exists)
 
-            # Check remote url of cache
+        # Check remote url of cache
+        if caching and cache_exists:
             command = 'if [ ! "$( git --git-dir "%s/.git" --work-tree "%s" config --get remote.origin.url )" = "%s" ]; then exit 1; else exit 0; fi' % (directory, directory, repo)
             description = 'Checking cached git repository'
             out, err, exitcode = self.execute.spinner(command, description)
             if exitcode == 1:
-                self.output.error('Failed as repository of "./git.cache.tar" != given repository')
+                self.output.error('Failed as repository of "%s" != given repository' % self._cache.get_path(self._get_cache_name('git')))
                 return False
 
         # Git clone
         if not caching or not cache_exists:
-            command = 'git clone "%s" "%s"' % (repo, directory)
+            command = git_env + 'git clone "%s" "%s"' % (repo, directory)
             description = 'Cloning repository \'%s\'' % repo
-            out, err, exitcode = self.execute.spinner(command, description)
+            out, err, exitcode = self._execute_network('git', command, description, before_retry='rm -rf "%s" && mkdir "%s"' % (directory, directory))
             if exitcode != 0:
                 self.output.error('Failed cloning repository \'%s\'\n%s' % (repo, '\n'.join(err)))
                 return False
 
-        # Checkout branch
-        command = 'git --git-dir "%s/.git" --work-tree "%s" checkout %s' % (directory, directory, branch)
-        description = 'Checking out branch \'%s\'' % branch
-        out, err, exitcode = self.execute.spinner(command, description)
-        if exitcode != 0:
-            self.output.error('Failed checking out branch \'%s\'\n%s' % (branch, '\n'.join(err)))
-            return False
-
-        # Fetch origin
+        # Fetch origin, before checking out branches that are newer than the cache
         if caching and cache_exists:
             command = 'git --git-dir "%s/.git" --work-tree "%s" fetch origin' % (directory, directory)
             description = 'Fetching from origin'
-            out, err, exitcode = self.execute.spinner(command, description)
+            out, err, exitcode = self._execute_network('git', command, description)
             if exitcode != 0:
                 self.output.error('Failed fetching from origin\n%s' % '\n'.join(err))
                 return False
 
-        # Reset to origin
+        # Checkout branch
+        command = git_env + 'git --git-dir "%s/.git" --work-tree "%s" checkout %s' % (directory, directory, branch)
+        description = 'Checking out branch \'%s\'' % branch
+        out, err, exitcode = self.execute.spinner(command, description)
+        if exitcode != 0:
+            self.output.error('Failed checking out branch \'%s\'\n%s' % (branch, '\n'.join(err)))
+            return False
+
+        # Reset to origin, the branch itself and not the default branch origin points at
         if caching and cache_exists:
-            command = 'git --git-dir "%s/.git" --work-tree "%s" reset --hard origin' % (directory, directory)
-            description = 'Resetting to origin'
+            command = git_env + 'git --git-dir "%s/.git" --work-tree "%s" reset --hard "origin/%s"' % (directory, directory, branch)
+            description = 'Resetting to origin/%s' % branch
             out, err, exitcode = self.execute.spinner(command, description)
             if exitcode != 0:
-                self.output.error('Failed resetting to origin\n%s' % '\n'.join(err))
+                self.output.error('Failed resetting to origin/%s\n%s' % (branch, '\n'.join(err)))
                 return False
 
         # Caching git repo
         if caching:
-            command = 'tar cf ./git.cache.tar -C "%s" .' % directory
-            description = 'Caching git repository'
-            out, err, exitcode = self.execute.spinner(command, description)
-            if exitcode != 0:
-                self.output.error('Failed caching git repository\n%s' % '\n'.join(err))
+            if not self._store_cache(self._get_cache_name('git'), directory, '.', 'git repository'):
                 return False
 
         self.output.success('Successfully cloned repository \'%s#%s\'' % (repo, branch))
         return True
 
-    def _composer_install(self, environment, directory, caching=True):
+    def _git_lfs_pull(self, environment, directory, storage):
+        """
+        Pull the git lfs objects of the checked out commit through a shared object store
+        :param environment: The environment
+        :param directory:   The directory
+        :param storage:     Directory of the shared git lfs object store
+        :return:            Success
+        """
+
+        if not os.path.isdir(storage):
+            os.makedirs(storage)
+
+        # Note: lfs-command requires to be in the working directory instead of --work-tree
+        command = 'cd "%s" && git -c lfs.storage="%s" --git-dir "%s/.git" lfs pull' % (directory, os.path.abspath(storage), directory)
+        description = 'Pulling git lfs objects'
+        out, err, exitcode = self._execute_network('git', command, description)
+        if exitcode != 0:
+            self.output.error('Failed pulling git lfs objects\n%s' % '\n'.join(err))
+            return False
+
+        self.output.success('Successfully pulled git lfs objects')
+        return True
+
+    def _composer_install(self, environment, directory, caching=True, options=None):
         """
         Composer install
         :param environment: The environment
         :param directory:   The directory
         :param caching:     Caching
+        :param options:     Composer options: prefer_dist, optimize_autoloader, classmap_authoritative, apcu_autoloader
         :return:            Success
         """
 
@@ -162,47 +213,165 @@ class BaseDriver(CuiScript):
             self.output.info('Skipped composer install')
             return True
 
-        # Cache exists
-        cache_exists = os.path.isfile('./composer.cache.tar')
+        # Options
+        options = options or {}
+        dev_options = ''
+        if environment == self.PRODUCTION or environment == self.STAGING:
+            dev_options += ' --no-dev'
+        # Note: dump-autoload names its options differently than install
+        autoloader_options = ''
+        dump_autoload_options = ''
+        if options.get('optimize_autoloader'):
+            autoloader_options += ' --optimize-autoloader'
+            dump_autoload_options += ' --optimize'
+        if options.get('classmap_authoritative'):
+            autoloader_options += ' --classmap-authoritative'
+            dump_autoload_options += ' --classmap-authoritative'
+        if options.get('apcu_autoloader'):
+            autoloader_options += ' --apcu-autoloader'
+            dump_autoload_options += ' --apcu'
+        install_options = dev_options + autoloader_options
+        if options.get('prefer_dist'):
+            install_options += ' --prefer-dist'
+
+        # With a lockfile, the cache is keyed by it, so a hit needs no install at all
+        cache = self._get_cache_name('composer')
+        # Scope of the keyed caches, which are evicted together
+        cache_prefix = '%s.%s.' % (self._get_cache_name('composer-lock'), environment)
+        autoloader_key = None
+        composer_lock = os.path.join(directory, 'composer.lock')
+        if os.path.isfile(composer_lock):
+            cache_key = hashlib.sha1(install_options.encode('utf-8'))
+            for path in (composer_json, composer_lock):
+                composer_file = open(path, 'rb')
+                try:
+                    cache_key.update(composer_file.read())
+                finally:
+                    composer_file.close()
+            cache = '%s%s' % (cache_prefix, cache_key.hexdigest()[:16])
+            autoloader_key = self._get_composer_autoloader_key(directory, install_options)
 
         # Extract cache
-        if caching and cache_exists:
-            command = 'tar xf ./composer.cache.tar -C "%s"' % directory
-            description = 'Extracting cached composer install'
+        cache_exists = False
+        if caching:
+            cache_exists = self._extract_cache(cache, directory, 'composer install')
+            if cache_exists is None:
+                return False
+            self._record_cache('composer', cache_exists)
+
+        autoloader_key_path = os.path.join(directory, 'vendor', '.deploy-autoloader-key')
+        cached_autoloader_key = None
+        if caching and cache_exists and autoloader_key is not None and os.path.isfile(autoloader_key_path):
+            autoloader_key_file = open(autoloader_key_path)
+            try:
+                cached_autoloader_key = autoloader_key_file.read().strip()
+            finally:
+                autoloader_key_file.close()
+
+        if cached_autoloader_key is not None and cached_autoloader_key == autoloader_key:
+            # Composer scripts still need to run, as their output isn't cached
+            for script in ('post-autoload-dump', 'post-install-cmd'):
+                command = 'composer --working-dir="%s" run-script %s%s' % (directory, script, dev_options)
+                description = 'Running composer %s-scripts' % script
+                out, err, exitcode = self.execute.spinner(command, description)
+                if exitcode != 0:
+                    self.output.error('Failed running composer %s-scripts\n%s' % (script, '\n'.join(err)))
+                    return False
+
+            self.output.success('Successfully reused cached composer install')
+            return True
+
+        if cached_autoloader_key is not None:
+            # Only the autoloaded sources changed
+            command = 'composer --working-dir="%s" dump-autoload%s' % (directory, dev_options + dump_autoload_options)
+            description = 'Dumping composer autoloader'
             out, err, exitcode = self.execute.spinner(command, description)
             if exitcode != 0:
-                self.output.error('Failed extracting cached composer install\n%s' % '\n'.join(err))
+                self.output.error('Failed dumping composer autoloader\n%s' % '\n'.join(err))
                 return False
 
-        # Composer install
-        command = 'composer --working-dir="%s" install' % directory
-        if environment == self.PRODUCTION or environment == self.STAGING:
-            command += ' --no-dev'
-        description = 'Running composer install'
-        out, err, exitcode = self.execute.spinner(command, description)
-        if exitcode != 0:
-            self.output.error('Failed running composer install\n%s' % '\n'.join(err))
-            return False
-
-        # Caching composer install
-        if caching:
-            command = 'tar cf ./composer.cache.tar -C "%s" vendor' % directory
-            description = 'Caching composer install'
+            command = 'composer --working-dir="%s" run-script post-install-cmd%s' % (directory, dev_options)
+            description = 'Running composer post-install-cmd-scripts'
             out, err, exitcode = self.execute.spinner(command, description)
             if exitcode != 0:
-                self.output.error('Failed caching composer install\n%s' % '\n'.join(err))
+                self.output.error('Failed running composer post-install-cmd-scripts\n%s' % '\n'.join(err))
                 return False
 
+        else:
+            # Composer install
+            def get_command(working_directory):
+                return 'composer --working-dir="%s" install%s' % (working_directory, install_options)
+            description = 'Running composer install'
+            out, err, exitcode = self._execute_network('composer', get_command, description, directory=directory, output='vendor')
+            if exitcode != 0:
+                self.output.error('Failed running composer install\n%s' % '\n'.join(err))
+                return False
+
+        # Caching composer install, including the autoloader
+        if caching:
+            if autoloader_key is not None:
+                autoloader_key_file = open(autoloader_key_path, 'w')
+                try:
+                    autoloader_key_file.write(autoloader_key)
+                finally:
+                    autoloader_key_file.close()
+
+            if not self._store_cache(cache, directory, 'vendor', 'composer install'):
+                return False
+
+            # Each composer.lock gets its own cache
+            if autoloader_key is not None:
+                self._evict_caches(cache_prefix, self._composer_cache_keep)
+
         self.output.success('Successfully ran composer install')
         return True
 
-    def _npm_install(self, environment, directory, caching=True):
+    def _get_composer_autoloader_key(self, directory, install_options):
+        """
+        Get a key of everything the composer autoloader is generated from
+        :param directory:       The directory
+        :param install_options: The options of composer install
+        :return:                Key, or None when it can't be determined
+        """
+
+        composer_json = open(os.path.join(directory, 'composer.json'))
+        try:
+            composer_config = json.load(composer_json)
+        except ValueError:
+            return None
+        finally:
+            composer_json.close()
+
+        # Paths of the project itself that are autoloaded
+        paths = []
+        for autoload in ('autoload', 'autoload-dev'):
+            autoload_config = composer_config.get(autoload, {})
+            for standard in ('psr-4', 'psr-0'):
+                for standard_paths in autoload_config.get(standard, {}).values():
+                    paths.extend(standard_paths if isinstance(standard_paths, list) else [standard_paths])
+            paths.extend(autoload_config.get('classmap', []))
+            paths.extend(autoload_config.get('files', []))
+
+        # Git knows the hash of the tree of each path
+        autoloader_key = hashlib.sha1(install_options.encode('utf-8'))
+        for path in sorted(set(paths)):
+            command = 'git --git-dir "%s/.git" --work-tree "%s" rev-parse "HEAD:%s"' % (directory, directory, path.strip('/'))
+            out, err, exitcode = self.execute(command)
+            if exitcode != 0 or not out:
+                return None
+            autoloader_key.update(('%s %s\n' % (path, out[0])).encode('utf-8'))
+
+        return autoloader_key.hexdigest()
+
+    def _npm_install(self, environment, directory, caching=True, cache_directory=None, ci=True):
         """
         Npm install
-        :param environment: The environment
-        :param directory:   THe directory
-        :param caching:     Caching
-        :return:            Success
+        :param environment:     The environment
+        :param directory:       THe directory
+        :param caching:         Caching
+        :param cache_directory: Persistent npm package cache
+        :param ci:              Use npm ci when a lockfile is available
+        :return:                Success
         """
 
         package_json = os.path.join(directory, 'package.json')
@@ -210,17 +379,29 @@ class BaseDriver(CuiScript):
             self.output.info('Skipped npm install')
             return True
 
-        # Cache exists
-        cache_exists = os.path.isfile('./npm.cache.tar')
+        # Npm ci removes node_modules anyway, so only a lockfile and the package cache matter
+        package_lock_json = os.path.join(directory, 'package-lock.json')
+        use_ci = ci and os.path.isfile(package_lock_json)
+
+        # Package cache
+        npm_cache_options = ''
+        npm_cache_exists = False
+        if caching and cache_directory is not None:
+            cache_directory = os.path.abspath(cache_directory)
+            # Only prefer offline after the first fetch populated the cache
+            npm_cache_exists = os.path.isdir(cache_directory) and bool(os.listdir(cache_directory))
+            if npm_cache_exists:
+                npm_cache_options += ' --prefer-offline'
+            npm_cache_options += ' --cache "%s"' % cache_directory
 
         # Extract cache
-        if caching and cache_exists:
-            command = 'tar xf ./npm.cache.tar -C "%s"' % directory
-            description = 'Extracting cached npm install'
-            out, err, exitcode = self.execute.spinner(command, description)
-            if exitcode != 0:
-                self.output.error('Failed extracting cached npm install\n%s' % '\n'.join(err))
+        cache_exists = False
+        if caching and not use_ci:
+            cache_exists = self._extract_cache(self._get_cache_name('npm'), directory, 'npm install')
+            if cache_exists is None:
                 return False
+        if caching:
+            self._record_cache('npm', npm_cache_exists if use_ci else cache_exists)
 
         # Prune cached
         if caching and cache_exists:
@@ -234,27 +415,187 @@ class BaseDriver(CuiScript):
                 return False
 
         # Npm install
-        command = 'npm install --prefix "%s"' % directory
-        if environment == self.PRODUCTION or environment == self.STAGING:
-            command += ' --production'
-        description = 'Running npm install'
-        out, err, exitcode = self.execute.spinner(command, description)
+        def get_command(working_directory):
+            command = 'npm %s --prefix "%s"' % ('ci' if use_ci else 'install', working_directory)
+            command += npm_cache_options
+            if environment == self.PRODUCTION or environment == self.STAGING:
+                command += ' --production'
+            return command
+        description = 'Running npm ci' if use_ci else 'Running npm install'
+        out, err, exitcode = self._execute_network('npm', get_command, description, directory=directory, output='node_modules')
         if exitcode != 0:
             self.output.error('Failed running npm install\n%s' % '\n'.join(err))
             return False
 
         # Caching npm install
-        if caching:
-            command = 'tar cf ./npm.cache.tar -C "%s" node_modules' % directory
-            description = 'Caching npm install'
-            out, err, exitcode = self.execute.spinner(command, description)
-            if exitcode != 0:
-                self.output.error('Failed caching npm install\n%s' % '\n'.join(err))
+        if caching and not use_ci:
+            if not self._store_cache(self._get_cache_name('npm'), directory, 'node_modules', 'npm install'):
                 return False
 
         self.output.success('Successfully ran npm install')
         return True
 
+    def _get_cache_name(self, cache):
+        """
+        Get the name of a cache that depends on the repository
+        :param cache:   Name of the cache
+        :return:        Name
+        """
+
+        if self._cache_namespace is None:
+            return cache
+        return '%s-%s' % (cache, self._cache_namespace)
+
+    def _extract_cache(self, cache, directory, subject):
+        """
+        Extract a cache into a directory
+        :param cache:       Name of the cache
+        :param directory:   The directory
+        :param subject:     What is cached, for output
+        :return:            True when extracted, False when there is no valid cache, None when failed
+        """
+
+        if not self._cache.exists(cache):
+            if not self._download_cache(cache, subject):
+                return False
+
+        # Hold a shared lock, so the cache can't be replaced between validating and extracting
+        with self._cache.lock(cache, shared=True):
+            description = 'Validating cached %s' % subject
+            out, err, exitcode = self.execute.spinner(self._cache.validate, description, (cache,))
+            if exitcode != 0:
+                self.output.warning('Ignoring invalid cached %s\n%s' % (subject, '\n'.join(err)))
+                return False
+            self._cache_checksums[cache] = self._cache.get_checksum(cache)
+            self._cache.touch(cache)
+
+            command = 'tar xf "%s" -C "%s"' % (self._cache.get_path(cache), directory)
+            description = 'Extracting cached %s' % subject
+            out, err, exitcode = self.execute.spinner(command, description)
+            if exitcode != 0:
+                self.output.error('Failed extracting cached %s\n%s' % (subject, '\n'.join(err)))
+                return None
+
+        return True
+
+    def _store_cache(self, cache, directory, path, subject):
+        """
+        Store a path of a directory in a cache
+        :param cache:       Name of the cache
+        :param directory:   The directory
+        :param path:        The path to cache, relative to the directory
+        :param subject:     What is cached, for output
+        :return:            Success
+        """
+
+        # Write to a temporary file first, so nobody reads a half-written cache
+        temp_path = self._cache.create(cache)
+
+        command = 'tar cf "%s" -C "%s" %s' % (temp_path, directory, path)
+        description = 'Caching %s' % subject
+        out, err, exitcode = self.execute.spinner(command, description)
+        if exitcode != 0:
+            self._cache.discard(temp_path)
+            self.output.error('Failed caching %s\n%s' % (subject, '\n'.join(err)))
+            return False
+
+        description = 'Storing cached %s' % subject
+        out, err, exitcode = self.execute.spinner(self._cache.commit, description, (cache, temp_path))
+        if exitcode != 0:
+            self.output.error('Failed storing cached %s\n%s' % (subject, '\n'.join(err)))
+            return False
+
+        # Upload after the deploy, and only when it changed since it was extracted
+        if self._cache_backend is not None and self._cache.get_checksum(cache) != self._cache_checksums.get(cache):
+            if (cache, subject) not in self._pending_uploads:
+                self._pending_uploads.append((cache, subject))
+        return True
+
+    def _evict_caches(self, prefix, keep):
+        """
+        Remove all but the most recently used local caches starting with a prefix
+        :param prefix:  Prefix of the names of the caches
+        :param keep:    Number of caches to keep
+        :return:        void
+        """
+
+        # Note: other hosts may still use them, so the remote cache is left to expire on its own
+        for cache in self._cache.get_names(prefix)[keep:]:
+            with self._cache.lock(cache, blocking=False) as locked:
+                # Being used by another deploy
+                if not locked:
+                    continue
+                self._cache.remove(cache)
+
+            self._pending_uploads = [(pending_cache, pending_subject) for pending_cache, pending_subject in self._pending_uploads
+                                     if pending_cache != cache]
+
+    def _download_cache(self, cache, subject):
+        """
+        Download a cache from the remote cache backend into the local cache
+        :param cache:       Name of the cache
+        :param subject:     What is cached, for output
+        :return:            Success
+        """
+
+        if self._cache_backend is None:
+            return False
+
+        def download_cache(cache_backend, local_cache, cache):
+            if not cache_backend.exists(cache):
+                return
+            temp_path = local_cache.create(cache)
+            try:
+                checksum = cache_backend.download(cache, temp_path)
+                local_cache.commit(cache, temp_path, expected_checksum=checksum)
+            finally:
+                local_cache.discard(temp_path)
+
+        description = 'Downloading remote cached %s' % subject
+        out, err, exitcode = self.execute.spinner(download_cache, description, (self._cache_backend, self._cache, cache))
+        if exitcode != 0:
+            self.output.warning('Failed downloading remote cached %s\n%s' % (subject, '\n'.join(err)))
+            return False
+
+        return self._cache.exists(cache)
+
+    def _upload_cache(self, cache, subject):
+        """
+        Upload a cache from the local cache to the remote cache backend
+        :param cache:       Name of the cache
+        :param subject:     What is cached, for output
+        :return:            Success
+        """
+
+        if self._cache_backend is None:
+            return False
+
+        def upload_cache(cache_backend, local_cache, cache):
+            # Keep the local cache from being replaced while uploading it
+            with local_cache.lock(cache, shared=True):
+                cache_backend.upload(cache, local_cache.get_path(cache), local_cache.get_checksum(cache))
+
+        description = 'Uploading cached %s' % subject
+        out, err, exitcode = self.execute.spinner(upload_cache, description, (self._cache_backend, self._cache, cache))
+        if exitcode != 0:
+            self.output.warning('Failed uploading cached %s\n%s' % (subject, '\n'.join(err)))
+            return False
+
+        return True
+
+    def _upload_caches(self):
+        """
+        Upload the caches that were stored meanwhile to the remote cache backend
+        :return:    Success
+        """
+
+        succeeded = True
+        for cache, subject in self._pending_uploads:
+            succeeded = self._upload_cache(cache, subject) and succeeded
+        self._pending_uploads = []
+
+        return succeeded
+
     def _submodules_update(self, environment, directory):
         """
         Update submodules
@@ -267,7 +608,7 @@ class BaseDriver(CuiScript):
         # Note: submodule-command requires to be in the working directory instead of --work-tree
         command = 'cd "%s" && git --git-dir "%s/.git" submodule update --init --recursive' % (directory, directory)
         description = 'Updating submodules'
-        out, err, exitcode = self.execute.spinner(command, description)
+        out, err, exitcode = self._execute_network('git', command, description)
         if exitcode != 0:
             self.output.error('Failed updating submodules\n%s' % '\n'.join(err))
             return False
@@ -275,6 +616,172 @@ class BaseDriver(CuiScript):
         self.output.success('Successfully updated submodules')
         return True
 
+    def _execute_network(self, step, command, description, directory=None, output=None, before_retry=None):
+        """
+        Execute a network-bound command with the timeout, retries and hedging configured for its step
+        :param step:            The step: git, composer, npm, deploy or git_push
+        :param command:         The command, or a function that gets the command for a working directory
+        :param description:     The description
+        :param directory:       Working directory of the command, to hedge it in a copy of it
+        :param output:          What the command installs in the working directory, like vendor
+        :param before_retry:    Command to run before retrying
+        :return:                Out, err and exitcode
+        """
+
+        config = self._network_config[step] if step in self._network_config else {}
+        timeout = float(config['timeout']) if 'timeout' in config else None
+        retries = int(config['retries']) if 'retries' in config else 0
+        backoff = float(config['backoff']) if 'backoff' in config else 5.0
+        hedge_after = float(config['hedge_after']) if 'hedge_after' in config and output is not None else None
+
+        get_command = command if callable(command) else lambda working_directory: command
+
+        attempt = 0
+        while True:
+            attempt_description = description if attempt == 0 else '%s (retry %i of %i)' % (description, attempt, retries)
+
+            if timeout is not None or hedge_after is not None:
+                result = dict()
+                out, err, exitcode = self.execute.spinner(self._execute_process, attempt_description, (get_command, timeout, directory, output, hedge_after, result))
+                if exitcode != 0 and 'exitcode' in result:
+                    exitcode = result['exitcode']
+                if 'hedged' in result:
+                    self._record_network_attempt(step, 'hedges')
+                if 'timed_out' in result:
+                    self._record_network_attempt(step, 'timeouts')
+            else:
+                out, err, exitcode = self.execute.spinner(get_command(directory), attempt_description)
+
+            if exitcode == 0 or attempt >= retries:
+                return out, err, exitcode
+
+            attempt += 1
+            self._record_network_attempt(step, 'retries')
+            self.output.warning('%s failed, retrying in %.1fs' % (description, backoff * 2 ** (attempt - 1)))
+            time.sleep(backoff * 2 ** (attempt - 1))
+
+            if before_retry is not None:
+                self.execute(before_retry)
+
+    def _execute_process(self, get_command, timeout, directory, output, hedge_after, result):
+        """
+        Execute a command with a timeout. When hedging, a second attempt is started in a clean copy of its
+        working directory once the first one is slow, and the output of the first attempt to succeed is kept.
+        :param get_command: Function that gets the command for a working directory
+        :param timeout:     Seconds before an attempt is stopped
+        :param directory:   Working directory of the command
+        :param output:      What the command installs in the working directory, like vendor
+        :param hedge_after: Seconds to wait before starting the second attempt
+        :param result:      Dict to set the exitcode, and whether it timed out or was hedged in
+        :return:            void
+        """
+
+        attempts = []
+        hedge_directory = '%s.hedge' % directory.rstrip('/') if hedge_after is not None else None
+
+        def start(attempt_directory):
+            err_file = tempfile.TemporaryFile()
+            # Own process group, so all its commands can be stopped
+            process = subprocess.Popen(get_command(attempt_directory), shell=True, stdout=err_file, stderr=subprocess.STDOUT, preexec_fn=os.setsid)
+            self._processes.append(process)
+            attempts.append({'process': process, 'err_file': err_file, 'directory': attempt_directory, 'started_at': time.time()})
+
+        start(directory)
+        winner = None
+        try:
+            while winner is None:
+                running = False
+                for attempt in attempts:
+                    process = attempt['process']
+                    if process.poll() is None and timeout is not None and time.time() - attempt['started_at'] >= timeout:
+                        self._kill_process(process)
+                        attempt['timed_out'] = True
+                        result['timed_out'] = True
+                    if process.returncode == 0:
+                        winner = attempt
+                        break
+                    running = running or process.returncode is None
+
+                if winner is not None:
+                    break
+
+                if not running:
+                    attempt = attempts[0]
+                    result['exitcode'] = 124 if 'timed_out' in attempt else attempt['process'].returncode
+                    attempt['err_file'].seek(0)
+                    message = attempt['err_file'].read().decode('utf-8', 'replace')
+                    if 'timed_out' in attempt:
+                        message += '\nTimed out after %is' % timeout
+                    raise RuntimeError(message)
+
+                # Hedge
+                if hedge_directory is not None and len(attempts) == 1 and time.time() - attempts[0]['started_at'] >= hedge_after:
+                    self._copy_hedge_directory(directory, hedge_directory, output)
+                    start(hedge_directory)
+                    result['hedged'] = True
+
+                time.sleep(0.5)
+        finally:
+            for attempt in attempts:
+                self._kill_process(attempt['process'])
+                attempt['err_file'].close()
+
+            # Keep the output of the winner in place
+            if winner is not None and len(attempts) > 1 and winner is attempts[1]:
+                output_path = os.path.join(directory, output)
+                if os.path.isdir(output_path):
+                    shutil.rmtree(output_path)
+                os.rename(os.path.join(hedge_directory, output), output_path)
+            if len(attempts) > 1:
+                shutil.rmtree(hedge_directory, ignore_errors=True)
+
+        result['exitcode'] = 0
+
+    def _copy_hedge_directory(self, directory, hedge_directory, output):
+        """
+        Copy a working directory to hedge a command in, without its git repository and the output of the command
+        :param directory:       The working directory
+        :param hedge_directory: Directory to copy to
+        :param output:          What the command installs in the working directory, like vendor
+        :return:                void
+        """
+
+        if os.path.isdir(hedge_directory):
+            shutil.rmtree(hedge_directory)
+        os.makedirs(hedge_directory)
+
+        # The first attempt is still writing its output, the rest is only read, so hard links will do
+        for name in os.listdir(directory):
+            if name in ('.git', output):
+                continue
+            subprocess.check_call(['cp', '-al', os.path.join(directory, name), hedge_directory])
+
+    def _kill_process(self, process):
+        """
+        Stop a process from _execute_process, with the commands it started
+        :param process: The process
+        :return:        void
+        """
+
+        if process.poll() is None:
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except OSError:
+                pass
+            process.wait()
+
+        if process in self._processes:
+            self._processes.remove(process)
+
+    def _kill_processes(self):
+        """
+        Stop all processes from _execute_process that are still running
+        :return:    void
+        """
+
+        for process in list(self._processes):
+            self._kill_process(process)
+
     def _get_current_user(self):
         """
         Get the current user
@@ -287,6 +794,65 @@ class BaseDriver(CuiScript):
             return User(out[0])
         return None
 
+    def _get_commit_hash(self, directory, revision='HEAD'):
+        """
+        Get the hash of the checked out commit
+        :param directory:   The directory
+        :param revision:    Revision to get the hash of instead
+        :return:            Hash
+        """
+
+        out, err, exitcode = self.execute('git --git-dir "%s/.git" --work-tree "%s" rev-parse %s' % (directory, directory, revision))
+
+        if exitcode == 0 and out:
+            return out[0]
+        return None
+
+    def _get_remote_commit_hash(self, repo, branch):
+        """
+        Get the hash of the head of a remote branch
+        :param repo:    The link to the repo
+        :param branch:  The branch
+        :return:        Hash
+        """
+
+        out, err, exitcode = self.execute('git ls-remote "%s" "refs/heads/%s"' % (repo, branch))
+
+        if exitcode == 0 and out and out[0]:
+            return out[0].split()[0]
+        return None
+
+    def _get_argument(self, arguments, name, default=None):
+        """
+        Get the value of an option like --name value or --name=value
+        :param arguments:   The arguments
+        :param name:        Name of the option
+        :param default:     Default value
+        :return:            Value
+        """
+
+        if not arguments:
+            return default
+
+        arguments = list(arguments)
+        for index, argument in enumerate(arguments):
+            if argument == '--%s' % name and index + 1 < len(arguments):
+                return arguments[index + 1]
+            if argument.startswith('--%s=' % name):
+                return argument[len(name) + 3:]
+
+        return default
+
+    def _has_argument(self, arguments, name):
+        """
+        Check if a flag like --name was given
+        :param arguments:   The arguments
+        :param name:        Name of the flag
+        :return:            Given
+        """
+
+        return bool(arguments) and '--%s' % name in arguments
+
     def _yaml_load(self, directory, filename):
         """
         Load yaml file
@@ -304,7 +870,7 @@ class BaseDriver(CuiScript):
         yaml_file = open(yaml_path)
         try:
             yaml_content = yaml.safe_load(yaml_file)
-        except OSError:
+        except (OSError, yaml.YAMLError):
             self.output.error('Could not load \'%s\'' % filename)
             return False
         finally:
@@ -353,6 +919,427 @@ class BaseDriver(CuiScript):
         self._slack_integration = Slack(web_hook_url, channel=channel, username=username, icon=icon)
         return True
 
+    def _set_network_config(self, config):
+        """
+        Set the timeouts, retries and hedging of the network-bound steps
+        :param config:  The config
+        :return:        Success
+        """
+
+        for step in config:
+            if step not in ('git', 'composer', 'npm', 'deploy', 'git_push'):
+                self.output.error('Unknown network step \'%s\'' % step)
+                return False
+            if 'hedge_after' in config[step] and step not in ('composer', 'npm'):
+                self.output.error('Only composer and npm can be hedged, not \'%s\'' % step)
+                return False
+
+        self._network_config = config
+        return True
+
+    def _set_deploy_history(self, path):
+        """
+        Set deploy history
+        :param path:    Path to the database
+        :return:        void
+        """
+
+        self._deploy_history = DeployHistory(path)
+
+    def _start_deploy_run(self, environment, branch, project=None):
+        """
+        Start recording a deploy run
+        :param environment: The environment
+        :param branch:      The branch
+        :param project:     Name of the project, when deploying one of several
+        :return:            Deploy run
+        """
+
+        user = self._get_current_user()
+        self._deploy_run = DeployRun(environment, branch, user.name if user is not None else None, project=project)
+        return self._deploy_run
+
+    def _run_stage(self, stage, callback, *args, **kwargs):
+        """
+        Run a stage of the deploy and record its duration
+        :param stage:       Name of the stage
+        :param callback:    The callback
+        :return:            Result of the callback
+        """
+
+        # Completed in the run that is being resumed
+        if self._checkpoint is not None and stage in self._checkpoint['completed']:
+            self.output.info('Skipped %s, completed in run %s' % (stage, self._checkpoint['run_id']))
+            return self._checkpoint['results'][stage] if stage in self._checkpoint['results'] else True
+
+        started_at = time.time()
+        try:
+            result = callback(*args, **kwargs)
+        finally:
+            if self._deploy_run is not None:
+                self._deploy_run.stage_durations[stage] = time.time() - started_at
+
+        # Checkpoint
+        if result and self._checkpoint is not None:
+            self._checkpoint['completed'].append(stage)
+            if isinstance(result, dict):
+                # Later stages may still change the result
+                self._checkpoint['results'][stage] = copy.deepcopy(result)
+            if not self._save_checkpoint():
+                return False
+
+        return result
+
+    def _set_deploy_commit(self, directory):
+        """
+        Set the commit that is being deployed
+        :param directory:   The directory
+        :return:            Commit hash
+        """
+
+        # When resuming, the workspace may already contain a release commit
+        if self._checkpoint is not None and self._checkpoint['commit'] is not None:
+            commit = self._checkpoint['commit']
+        else:
+            commit = self._get_commit_hash(directory)
+
+        if self._deploy_run is not None:
+            self._deploy_run.commit = commit
+        if self._checkpoint is not None:
+            self._checkpoint['commit'] = commit
+            self._save_checkpoint()
+        self._update_status(commit=commit)
+
+        return commit
+
+    def _set_release_commit(self, directory, commit):
+        """
+        Set the release commit that was pushed on top of the deployed commit
+        :param directory:   The directory
+        :param commit:      The deployed commit
+        :return:            Release commit hash, None when others pushed before it
+        """
+
+        # Commits that were pushed meanwhile ended up between them, but weren't deployed
+        if self._get_commit_hash(directory, 'HEAD^') != commit:
+            return None
+
+        release_commit = self._get_commit_hash(directory)
+        if self._deploy_run is not None:
+            self._deploy_run.release_commit = release_commit
+        self._update_status(release_commit=release_commit)
+
+        return release_commit
+
+    def _start_checkpoint(self, checkpoints_directory, environment, branch, config_hash, project=None, retention=3):
+        """
+        Start checkpointing a new run, so it can be resumed when it fails
+        :param checkpoints_directory:   Directory to keep the checkpoints in
+        :param environment:             The environment
+        :param branch:                  The branch
+        :param config_hash:             Hash of the config
+        :param project:                 Name of the project, when deploying one of several
+        :param retention:               Number of failed runs of the project and environment to keep the checkpoint of
+        :return:                        Working directory
+        """
+
+        self._prune_checkpoints(checkpoints_directory, environment, project, retention)
+
+        run_id = '%s-%s' % (datetime.utcnow().strftime('%Y%m%d%H%M%S'), binascii.hexlify(os.urandom(3)).decode('ascii'))
+        self._checkpoint_directory = os.path.abspath(os.path.join(checkpoints_directory, run_id))
+        os.makedirs(os.path.join(self._checkpoint_directory, 'workspace'))
+        # Locked before checkpoint.yaml exists, so it's never pruned while running
+        self._checkpoint_lock = self._lock_checkpoint(self._checkpoint_directory)
+
+        self._checkpoint = {
+            'run_id': run_id,
+            'project': project,
+            'environment': environment,
+            'branch': branch,
+            'config_hash': config_hash,
+            'commit': None,
+            'completed': [],
+            'results': {},
+        }
+        if not self._save_checkpoint():
+            return False
+
+        self._update_status(run_id=run_id)
+        self.output.info('Started run %s' % run_id)
+        return os.path.join(self._checkpoint_directory, 'workspace')
+
+    def _resume_checkpoint(self, checkpoints_directory, run_id, environment, config_hash, project=None):
+        """
+        Resume a run from its checkpoint
+        :param checkpoints_directory:   Directory to keep the checkpoints in
+        :param run_id:                  Id of the run
+        :param environment:             The environment
+        :param config_hash:             Hash of the config
+        :param project:                 Name of the project, when deploying one of several
+        :return:                        Working directory
+        """
+
+        checkpoint_directory = os.path.abspath(os.path.join(checkpoints_directory, run_id))
+        checkpoint = self._yaml_load(checkpoint_directory, 'checkpoint.yaml')
+        if not checkpoint:
+            self.output.error('Could not resume run %s' % run_id)
+            return False
+
+        if checkpoint.get('project') != project:
+            self.output.error('Run %s was a deploy of %s' % (run_id, checkpoint.get('project') or 'no project in particular'))
+            return False
+
+        if checkpoint['environment'] != environment:
+            self.output.error('Run %s was a %s deploy, not %s' % (run_id, checkpoint['environment'], environment))
+            return False
+
+        if checkpoint['config_hash'] != config_hash:
+            self.output.error('deploy.yaml has changed since run %s' % run_id)
+            return False
+
+        self._checkpoint_lock = self._lock_checkpoint(checkpoint_directory)
+        if self._checkpoint_lock is None:
+            self.output.error('Run %s is still running' % run_id)
+            return False
+
+        self._checkpoint_directory = checkpoint_directory
+        self._checkpoint = checkpoint
+        self._update_status(run_id=run_id)
+
+        self.output.info('Resuming run %s after %s' % (run_id, ', '.join(checkpoint['completed']) or 'nothing'))
+        return os.path.join(checkpoint_directory, 'workspace')
+
+    def _save_checkpoint(self):
+        """
+        Save the checkpoint of the current run
+        :return:    Success
+        """
+
+        return self._yaml_dump(self._checkpoint_directory, 'checkpoint.yaml', self._checkpoint)
+
+    def _finish_checkpoint(self, succeeded):
+        """
+        Remove the checkpoint of a succeeded run, keep it otherwise
+        :param succeeded:   Success
+        :return:            void
+        """
+
+        checkpoint = self._checkpoint
+        self._checkpoint = None
+        if checkpoint is None:
+            return
+
+        if succeeded:
+            shutil.rmtree(self._checkpoint_directory)
+        else:
+            self.output.info('Resume this deploy with: --resume %s' % checkpoint['run_id'])
+        self._checkpoint_directory = None
+
+        if self._checkpoint_lock is not None:
+            self._checkpoint_lock.close()
+            self._checkpoint_lock = None
+
+    def _lock_checkpoint(self, checkpoint_directory):
+        """
+        Lock the checkpoint of a run while it's running
+        :param checkpoint_directory:    Directory of the checkpoint
+        :return:                        The locked file, None when it's already locked
+        """
+
+        lock_file = open(os.path.join(checkpoint_directory, 'checkpoint.lock'), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            lock_file.close()
+            return None
+
+        return lock_file
+
+    def _prune_checkpoints(self, checkpoints_directory, environment, project, retention):
+        """
+        Remove the checkpoints of all but the last failed runs of a project and environment
+        :param checkpoints_directory:   Directory to keep the checkpoints in
+        :param environment:             The environment
+        :param project:                 Name of the project, when deploying one of several
+        :param retention:               Number of failed runs to keep the checkpoint of
+        :return:                        void
+        """
+
+        if not os.path.isdir(checkpoints_directory):
+            return
+
+        # Run ids start with the time they started
+        kept = 0
+        for run_id in sorted(os.listdir(checkpoints_directory), reverse=True):
+            checkpoint_directory = os.path.join(checkpoints_directory, run_id)
+            if not os.path.isfile(os.path.join(checkpoint_directory, 'checkpoint.yaml')):
+                continue
+
+            # Still running
+            lock_file = self._lock_checkpoint(checkpoint_directory)
+            if lock_file is None:
+                continue
+
+            try:
+                checkpoint = self._yaml_load(checkpoint_directory, 'checkpoint.yaml')
+                if not checkpoint or checkpoint.get('project') != project or checkpoint.get('environment') != environment:
+                    continue
+                if kept < retention:
+                    kept += 1
+                else:
+                    shutil.rmtree(checkpoint_directory)
+                    self.output.info('Removed checkpoint of run %s' % run_id)
+            finally:
+                lock_file.close()
+
+    def _record_network_attempt(self, step, kind):
+        """
+        Record a retry, timeout or hedge of a network-bound step
+        :param step:    The step
+        :param kind:    retries, timeouts or hedges
+        :return:        void
+        """
+
+        if self._deploy_run is None:
+            return
+
+        attempts = self._deploy_run.network_attempts.setdefault(step, {'retries': 0, 'timeouts': 0, 'hedges': 0})
+        attempts[kind] += 1
+        self._update_status(network=self._deploy_run.network_attempts)
+
+    def _output_network_summary(self):
+        """
+        Output the retries, timeouts and hedges of the network-bound steps of this run
+        :return:    void
+        """
+
+        if self._deploy_run is None or not self._deploy_run.network_attempts:
+            return
+
+        self.output.title('Network')
+        for step in sorted(self._deploy_run.network_attempts):
+            attempts = self._deploy_run.network_attempts[step]
+            self.output('%-10s retries: %i   timeouts: %i   hedges: %i' % (step, attempts['retries'], attempts['timeouts'], attempts['hedges']))
+        self.output('')
+
+    def _record_cache(self, cache, hit):
+        """
+        Record a cache hit or miss
+        :param cache:   Name of the cache
+        :param hit:     Hit or miss
+        :return:        void
+        """
+
+        if self._deploy_run is not None:
+            self._deploy_run.cache_hits[cache] = hit
+
+    def _finish_deploy_run(self, succeeded):
+        """
+        Finish recording the deploy run and save it in the deploy history
+        :param succeeded:   Success
+        :return:            Success
+        """
+
+        deploy_run = self._deploy_run
+        self._deploy_run = None
+        if deploy_run is None:
+            return False
+
+        deploy_run.result = DeployRun.RESULT_SUCCEEDED if succeeded else DeployRun.RESULT_FAILED
+        deploy_run.duration = time.time() - deploy_run.started_at
+
+        if self._deploy_history is None:
+            return False
+
+        try:
+            self._deploy_history.save(deploy_run)
+        except sqlite3.Error as e:
+            self.output.warning('Could not save deploy in history: %s' % e)
+            return False
+
+        return True
+
+    def _set_cache(self, config):
+        """
+        Set the local cache and remote cache backend
+        :param config:  The config
+        :return:        Success
+        """
+
+        directory = config['directory'] if 'directory' in config else '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._cache = LocalCache(directory)
+        self._composer_cache_keep = int(config['composer_keep']) if 'composer_keep' in config else 5
+
+        remote = config['remote'] if 'remote' in config else None
+        if remote is None:
+            return True
+
+        backend_type = remote['type'] if 'type' in remote else None
+        if backend_type == 'directory':
+            if 'directory' not in remote:
+                self.output.error('\'directory\' is not set for the remote cache')
+                return False
+
+            self._cache_backend = DirectoryBackend(remote['directory'])
+
+        elif backend_type == 's3':
+            if 'bucket' not in remote:
+                self.output.error('\'bucket\' is not set for the remote cache')
+                return False
+
+            try:
+                from deploytools.cache.backends.s3backend import S3Backend
+            except ImportError:
+                self.output.error('boto3 is required for an s3 remote cache (pip install boto3)')
+                return False
+
+            self._cache_backend = S3Backend(remote['bucket'],
+                                            prefix=remote['prefix'] if 'prefix' in remote else '',
+                                            endpoint=remote['endpoint'] if 'endpoint' in remote else None,
+                                            region=remote['region'] if 'region' in remote else None,
+                                            access_key=remote['access_key'] if 'access_key' in remote else None,
+                                            secret_key=remote['secret_key'] if 'secret_key' in remote else None,
+                                            concurrency=remote['concurrency'] if 'concurrency' in remote else 10,
+                                            chunk_size=remote['chunk_size'] if 'chunk_size' in remote else 8)
+
+        else:
+            self.output.error('Unknown type \'%s\' for the remote cache' % backend_type)
+            return False
+
+        return True
+
+    def _set_status_file(self, path):
+        """
+        Set the file to keep the status of the deploy in, for the process that started it
+        :param path:    The path
+        :return:        void
+        """
+
+        self._status_file = path
+        self._status = dict()
+
+    def _update_status(self, **values):
+        """
+        Update the status of the deploy
+        :param values:  The values to update
+        :return:        Success
+        """
+
+        if self._status_file is None:
+            return False
+
+        self._status.update(values)
+
+        # Replaced at once, as it's read while the deploy is running
+        temp_path = '%s.tmp' % self._status_file
+        if not self._yaml_dump(os.path.dirname(temp_path), os.path.basename(temp_path), self._status):
+            return False
+        os.rename(temp_path, self._status_file)
+
+        return True
+
     def _notify_started(self, deploy_stage, name, environment, details=None):
         """
         Notify started
@@ -364,6 +1351,7 @@ class BaseDriver(CuiScript):
         """
 
         self._deploy_stage = deploy_stage
+        self._update_status(stage=deploy_stage)
         return self._notify(BaseDriver.NOTIFY_TYPE_STARTED, name, environment, details=details)
 
     def _notify_succeeded(self, name, environment, details=None):
@@ -386,6 +1374,11 @@ class BaseDriver(CuiScript):
         :return:            Success
         """
 
+        if self._deploy_run is not None and self._deploy_run.failure_stage is None:
+            self._deploy_run.failure_stage = details
+        if 'failure' not in self._status:
+            self._update_status(failure=details)
+
         return self._notify(BaseDriver.NOTIFY_TYPE_FAILED, name, environment, details=details)
 
     def _notify(self, notify_type, name, environment, details=None):
@@ -398,6 +1391,9 @@ class BaseDriver(CuiScript):
         :return:            Success
         """
 
+        if not self._notifications_enabled:
+            return False
+
         success = False
         success = self._notify_slack(notify_type, name, environment, details) or success
         return success
@@ -3,6 +3,12 @@ from deploytools.drivers.basedriver import BaseDriver
 import os
 import shutil
 import re
+import hashlib
+import signal
+import subprocess
+import sys
+import threading
+import time
 from datetime import datetime
 
 
@@ -20,9 +26,16 @@ class Gae(BaseDriver):
 
         super(Gae, self).__init__(base_path, title, description, arguments=arguments)
 
+        self._project = None
+
+        # Each deploy command accepts --resume <run-id> to resume a failed run,
+        # and --project <name> to only deploy one of the projects
         self._register_command('production', 'Deploy application for production', lambda *args, **kwargs: self.deploy(self.PRODUCTION, *args, **kwargs))
         self._register_command('staging', 'Deploy application for staging', lambda *args, **kwargs: self.deploy(self.STAGING, *args, **kwargs))
         self._register_command('development', 'Deploy application for development', lambda *args, **kwargs: self.deploy(self.DEVELOPMENT, *args, **kwargs))
+        self._register_command('warm', 'Bring the caches up to date without deploying', self.warm)
+        self._register_command('watch', 'Deploy each time the branch moves', self.watch)
+        self._register_command('stats', 'Show statistics of previous deploys', self.stats)
 
     def deploy(self, environment, arguments=None):
         """
@@ -32,24 +45,75 @@ class Gae(BaseDriver):
         :return:            void
         """
 
+        # Started by a multi-project deploy
+        status_file = self._get_argument(arguments, 'status-file')
+        if status_file is not None:
+            self._set_status_file(status_file)
+            # Clean up when the deploy gets cancelled
+            signal.signal(signal.SIGTERM, self._handle_terminate)
+        if self._has_argument(arguments, 'no-notify'):
+            self._notifications_enabled = False
+
+        succeeded = False
         try:
-            self._deploy(environment, arguments=arguments)
+            succeeded = self._deploy(environment, arguments=arguments)
             self.output('')
+            self._output_network_summary()
         finally:
+            self._update_status(result='succeeded' if succeeded else 'failed')
+            self._finish_deploy_run(succeeded)
+            self._finish_checkpoint(succeeded)
             self._clean_up()
 
+        # Only after the deploy, so it doesn't wait for the uploads
+        self._upload_caches()
+
     def _deploy(self, environment, arguments=None):
         """
         Actually deploy
         :param environment: The environment to deploy in
         :param arguments:   The arguments
-        :return:            void
+        :return:            Success
         """
 
         # Prepare
         if not self._load_config():
             return False
-        caching = self.config('deploy.caching', True)
+
+        # Projects
+        if self.config('projects', None):
+            project_name = self._get_argument(arguments, 'project')
+            if project_name is None:
+                return self._deploy_projects(environment, arguments=arguments)
+            if not self._select_project(project_name):
+                return False
+
+        caching = self._get_deploy_config('caching', True)
+        lfs = self._get_deploy_config('lfs.enabled', False)
+        checkpoints = self.config('deploy.checkpoints', './checkpoints')
+
+        # Config
+        name = self._get_deploy_config('name')
+        project = self._project['name'] if self._project is not None else None
+        repo = self._get_deploy_config('repository')
+        branch = self._get_deploy_config('branch', 'master')
+
+        # Resume
+        resume_run_id = self._get_argument(arguments, 'resume')
+        directory = None
+        if resume_run_id is not None:
+            if not checkpoints:
+                self.output.error('Can\'t resume as \'deploy > checkpoints\' is disabled in deploy.yaml')
+                return False
+            directory = self._resume_checkpoint(checkpoints, resume_run_id, environment, self._get_config_hash(), project=project)
+            if not directory:
+                return False
+            if not self._check_resumed_commit(repo, branch):
+                return False
+            # A clone that didn't complete can't be continued
+            if 'git_clone' not in self._checkpoint['completed']:
+                shutil.rmtree(directory)
+                os.makedirs(directory)
 
         # Confirm deploy
         warnings = []
@@ -57,14 +121,12 @@ class Gae(BaseDriver):
             warnings.append('Do not push any changes to app.yaml whilst deploying the application!')
         warnings.append('All database changes should be backwards compatible!')
         # Ask
-        if not self._deploy_confirm(environment, warnings):
+        if not self._deploy_confirm(environment, warnings, ask=not self._has_argument(arguments, 'yes')):
             return False
         self.output('')
 
-        # Config
-        name = self.config('deploy.name')
-        repo = self.config('deploy.repository')
-        branch = self.config('deploy.branch', 'master')
+        # Record deploy
+        self._start_deploy_run(environment, branch, project=project)
 
         # Notify started building
         self._notify_started(self.DEPLOY_STAGE_BUILDING, name, environment)
@@ -73,53 +135,71 @@ class Gae(BaseDriver):
         self.output.title('Preparing deploy')
         self.output('')
 
-        # Temp directory
-        directory = self._get_temp_dir()
+        # Working directory
+        if directory is None and checkpoints:
+            directory = self._start_checkpoint(checkpoints, environment, branch, self._get_config_hash(),
+                                               project=project,
+                                               retention=self.config('deploy.checkpoint_retention', 3))
+            if not directory:
+                return False
+        elif directory is None:
+            directory = self._get_temp_dir()
         # self.output.info('Working dir: %s' % directory)
 
         # Run before all commands
-        if not self._run_custom_commands(environment, directory, branch, 'before_all'):
+        if not self._run_stage('before_all', self._run_custom_commands, environment, directory, branch, 'before_all'):
             self._notify_failed(name, environment, 'Failed while running before_all-commands')
             return False
 
         # Git clone
-        if not self._git_clone(environment, directory, repo, branch, caching=caching):
+        if not self._run_stage('git_clone', self._git_clone, environment, directory, repo, branch, caching=caching, lfs=lfs):
             self._notify_failed(name, environment, 'Failed while cloning git')
             return False
+        commit = self._set_deploy_commit(directory)
+
+        # Git lfs pull
+        if not lfs:
+            self.output.info('Skipped git lfs pull')
+        elif not self._run_stage('git_lfs', self._git_lfs_pull, environment, directory, self._get_deploy_config('lfs.storage', './lfs.cache')):
+            self._notify_failed(name, environment, 'Failed while pulling git lfs objects')
+            return False
 
         # Copy persistent files
-        if not self._copy_persistent_files(directory):
+        if not self._run_stage('persistent_files', self._copy_persistent_files, directory):
             self._notify_failed(name, environment, 'Failed while copying persistent files')
             return False
 
         # Load app.yaml
-        app_yaml = self._get_app_yaml(directory)
+        app_yaml = self._run_stage('app_yaml', self._get_app_yaml, directory)
         if not app_yaml:
             self._notify_failed(name, environment, 'Failed while loading app.yaml')
             return False
 
         # Update submodules
-        if not self._submodules_update(environment, directory):
+        if not self._run_stage('submodules', self._submodules_update, environment, directory):
             self._notify_failed(name, environment, 'Failed while updating submodules')
             return False
 
         # Composer install
-        if not self._composer_install(environment, directory, caching=caching):
+        composer_options = self._get_deploy_config('composer.%s' % environment, {})
+        if not self._run_stage('composer_install', self._composer_install, environment, directory, caching=caching, options=composer_options):
             self._notify_failed(name, environment, 'Failed while running composer install')
             return False
 
         # Npm install
-        if not self._npm_install(environment, directory, caching=caching):
+        npm_cache_directory = self._get_deploy_config('npm.cache', './npm.cache')
+        npm_ci = self._get_deploy_config('npm.ci', True)
+        if not self._run_stage('npm_install', self._npm_install, environment, directory, caching=caching, cache_directory=npm_cache_directory, ci=npm_ci):
             self._notify_failed(name, environment, 'Failed while running npm install')
             return False
 
         # Update app.yaml version
-        if not self._update_app_yaml_version(environment, directory, app_yaml, branch):
+        if not self._run_stage('app_yaml_version', self._update_app_yaml_version, environment, directory, app_yaml, branch):
             self._notify_failed(name, environment, 'Failed while updating app.yaml version')
             return False
 
         # Run before deploy commands
-        if not self._run_custom_commands(environment, directory, branch, 'before_deploy'):
+        if not self._run_stage('before_deploy', self._run_custom_commands, environment, directory, branch, 'before_deploy'):
             self._notify_failed(name, environment, 'Failed while running before_deploy-commands')
             return False
 
@@ -128,24 +208,529 @@ class Gae(BaseDriver):
         self._notify_started(self.DEPLOY_STAGE_DEPLOYING, name, environment)
 
         # Deploy application
-        if not self._deploy_to_gae(directory):
+        if not self._run_stage('deploy', self._deploy_to_gae, directory):
             self._run_custom_commands(environment, directory, branch, 'after_failed')
             self._notify_failed(name, environment, 'Failed while deploying application')
             return False
 
         # Push new version
         if environment == self.PRODUCTION:
-            if not self._git_push(environment, directory):
+            if not self._run_stage('git_push', self._git_push, environment, directory):
                 self._notify_failed(name, environment, 'Failed while pushing new version')
                 return False
+            self._set_release_commit(directory, commit)
 
         # Run after success
-        if not self._run_custom_commands(environment, directory, branch, 'after_success'):
+        if not self._run_stage('after_success', self._run_custom_commands, environment, directory, branch, 'after_success'):
             self._notify_failed(name, environment, 'Failed while running after_success-commands')
             return False
 
         self.output.success('Successfully finished deploy sequence')
         self._notify_succeeded(name, environment)
+        return True
+
+    def _deploy_projects(self, environment, arguments=None):
+        """
+        Deploy all projects in parallel, each in its own process
+        :param environment: The environment to deploy in
+        :param arguments:   The arguments
+        :return:            Success
+        """
+
+        if self._get_argument(arguments, 'resume') is not None:
+            self.output.error('Resume the deploy of a single project with --project <name> --resume <run-id>')
+            return False
+
+        projects = self.config('projects')
+        name = self.config('deploy.name', '%i projects' % len(projects))
+        parallel = max(1, int(self.config('deploy.parallel', 4)))
+        logs = self.config('deploy.logs', './logs')
+
+        # Confirm deploy, once for all projects
+        warnings = ['Deploying %s' % ', '.join([project['name'] for project in projects])]
+        if environment == self.PRODUCTION:
+            warnings.append('Do not push any changes to app.yaml whilst deploying the application!')
+        warnings.append('All database changes should be backwards compatible!')
+        # Ask
+        if not self._deploy_confirm(environment, warnings, ask=not self._has_argument(arguments, 'yes')):
+            return False
+        self.output('')
+
+        self._notify_started(self.DEPLOY_STAGE_DEPLOYING, name, environment, details='\n'.join([project['name'] for project in projects]))
+
+        self.output.title('Deploying %i projects, %i at a time' % (len(projects), parallel))
+        self.output('')
+
+        if not os.path.isdir(logs):
+            os.makedirs(logs)
+        status_directory = self._get_temp_dir()
+
+        # Workers take the next project until none are left
+        queue = list(projects)
+        statuses = dict()
+        lock = threading.Lock()
+
+        def deploy_projects():
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    project = queue.pop(0)
+                    self.output.info('Started deploying %s' % project['name'])
+
+                status = self._deploy_project_process(environment, project, logs, status_directory)
+
+                with lock:
+                    statuses[project['name']] = status
+                    if status['result'] == 'succeeded':
+                        self.output.success('Successfully deployed %s' % project['name'])
+                    else:
+                        self.output.error('Failed deploying %s' % project['name'])
+
+        workers = [threading.Thread(target=deploy_projects) for i in range(min(parallel, len(projects)))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.output('')
+
+        # Summary
+        self.output.title('Summary')
+        succeeded = True
+        details = []
+        for project in projects:
+            status = statuses[project['name']]
+            line = '%-30s %-10s %7.1fs' % (project['name'], status['result'], status['duration'])
+            if status.get('network'):
+                line += '   %s' % ', '.join(['%s: %i retries, %i timeouts' % (step, attempts['retries'], attempts['timeouts'])
+                                             for step, attempts in sorted(status['network'].items())])
+            if status['result'] != 'succeeded':
+                succeeded = False
+                line += '   %s' % (status['failure'] if 'failure' in status else 'Failed, see %s' % status['log'])
+                if 'run_id' in status:
+                    line += ' (--project "%s" --resume %s)' % (project['name'], status['run_id'])
+            self.output(line)
+            details.append(line)
+        self.output('')
+
+        if succeeded:
+            self.output.success('Successfully deployed all projects')
+            self._notify_succeeded(name, environment, details='\n'.join(details))
+        else:
+            self.output.error('Failed deploying some projects')
+            self._notify_failed(name, environment, details='\n'.join(details))
+        return succeeded
+
+    def _deploy_project_process(self, environment, project, logs, status_directory):
+        """
+        Deploy a project in its own process
+        :param environment:         The environment to deploy in
+        :param project:             The project
+        :param logs:                Directory to keep the output in
+        :param status_directory:    Directory to keep the status in
+        :return:                    Status
+        """
+
+        slug = self._get_project_slug(project['name'])
+        log_path = os.path.join(logs, '%s.log' % slug)
+        status_path = os.path.join(status_directory, '%s.yaml' % slug)
+
+        command = self._get_deploy_command(environment, status_path, project_name=project['name']) + ['--no-notify']
+
+        started_at = time.time()
+        log_file = open(log_path, 'w')
+        try:
+            subprocess.call(command, stdout=log_file, stderr=subprocess.STDOUT)
+        finally:
+            log_file.close()
+
+        status = self._yaml_load(status_directory, '%s.yaml' % slug) if os.path.isfile(status_path) else None
+        if not status or 'result' not in status:
+            status = {'result': 'failed'}
+        status['duration'] = time.time() - started_at
+        status['log'] = log_path
+
+        return status
+
+    def _get_project_slug(self, name):
+        """
+        Get the slug of a project, to name its log and status files after
+        :param name:    Name of the project
+        :return:        Slug
+        """
+
+        return re.sub('[^a-z0-9]+', '-', name.lower()).strip('-')
+
+    def _get_deploy_command(self, environment, status_path, project_name=None):
+        """
+        Get the command to deploy in another process
+        :param environment:     The environment to deploy in
+        :param status_path:     File for the process to keep its status in
+        :param project_name:    Name of the project to deploy
+        :return:                Command
+        """
+
+        command = [sys.executable, sys.argv[0], 'gae', environment, '--yes', '--status-file', status_path]
+        if project_name is not None:
+            command += ['--project', project_name]
+
+        return command
+
+    def _handle_terminate(self, signum, frame):
+        """
+        Handle SIGTERM by exiting, so the deploy cleans up after itself
+        :param signum:  The signal
+        :param frame:   The frame
+        :return:        void
+        """
+
+        # Commands with a timeout run in their own process group
+        self._kill_processes()
+        raise SystemExit(1)
+
+    def watch(self, arguments=None):
+        """
+        Watch the branch and deploy each time it moves
+        :param arguments:   The arguments
+        :return:            void
+        """
+
+        try:
+            self._watch(arguments=arguments)
+            self.output('')
+        finally:
+            self._clean_up()
+
+    def _watch(self, arguments=None):
+        """
+        Actually watch the branch, deploying its head once it stopped moving
+        :param arguments:   The arguments
+        :return:            Success
+        """
+
+        # Prepare
+        if not self._load_config():
+            return False
+
+        # Projects
+        project_name = self._get_argument(arguments, 'project')
+        if self.config('projects', None):
+            if project_name is None:
+                self.output.error('Watch one of the projects with --project <name>')
+                return False
+            if not self._select_project(project_name):
+                return False
+
+        # Config
+        environment = self._get_argument(arguments, 'environment', self._get_deploy_config('watch.environment', self.STAGING))
+        if environment not in (self.PRODUCTION, self.STAGING, self.DEVELOPMENT):
+            self.output.error('Unknown environment \'%s\'' % environment)
+            return False
+        project = self._project['name'] if self._project is not None else None
+        repo = self._get_deploy_config('repository')
+        branch = self._get_deploy_config('branch', 'master')
+        interval = float(self._get_deploy_config('watch.interval', 60))
+        debounce = float(self._get_deploy_config('watch.debounce', 120))
+        checkpoints = self.config('deploy.checkpoints', './checkpoints')
+
+        # Start from the last deploy
+        deployed_commits = []
+        if self._deploy_history is not None:
+            deployed_commits.append(self._deploy_history.get_last_commit(environment, branch, project=project))
+        failed_commit = None
+
+        self.output.title('Watching \'%s#%s\' to deploy %s' % (repo, branch, environment))
+        self.output('')
+
+        status_directory = self._get_temp_dir()
+        status_path = os.path.join(status_directory, 'status.yaml')
+
+        head = None
+        head_moved_at = None
+        process = None
+        process_commit = None
+        next_poll_at = 0
+        try:
+            while True:
+                # Finished deploy
+                if process is not None and process.poll() is not None:
+                    status = self._yaml_load(status_directory, 'status.yaml') if os.path.isfile(status_path) else None
+                    if status and status.get('result') == 'succeeded':
+                        # The branch may have moved before it was cloned
+                        deployed_commits = [process_commit, status.get('commit', process_commit)]
+                        # A production deploy pushes a release commit, which shouldn't be deployed again
+                        if status.get('release_commit'):
+                            deployed_commits.append(status['release_commit'])
+                        self.output.success('Successfully deployed %s' % deployed_commits[0])
+                    else:
+                        # Don't retry the same commit over and over
+                        failed_commit = process_commit
+                        self.output.error('Failed deploying %s' % process_commit)
+                    process = None
+
+                # Poll the head of the branch
+                if time.time() >= next_poll_at:
+                    next_poll_at = time.time() + interval
+                    remote_commit = self._get_remote_commit_hash(repo, branch)
+                    if remote_commit is None:
+                        self.output.warning('Failed fetching the head of branch \'%s\'' % branch)
+                    elif remote_commit != head:
+                        head = remote_commit
+                        head_moved_at = time.time()
+                        self.output.info('Branch \'%s\' is at %s' % (branch, head))
+
+                        # Cancel a build that has been superseded, but let a deploy to GAE finish
+                        if process is not None and process_commit != head:
+                            status = self._yaml_load(status_directory, 'status.yaml') if os.path.isfile(status_path) else {}
+                            # Unless it's known to be building, it may be deploying already
+                            if (status or {}).get('stage') == self.DEPLOY_STAGE_BUILDING:
+                                self.output.info('Cancelling the superseded build of %s' % process_commit)
+                                self._cancel_deploy_process(process, status_directory, checkpoints)
+                                process = None
+
+                # Deploy once the branch stopped moving
+                if process is None and head is not None and head not in deployed_commits + [failed_commit] \
+                        and time.time() - head_moved_at >= debounce:
+                    self.output.info('Started deploying %s' % head)
+                    if os.path.isfile(status_path):
+                        os.remove(status_path)
+                    # Own process group, so cancelling also stops the commands it runs
+                    process = subprocess.Popen(self._get_deploy_command(environment, status_path, project_name=project_name), preexec_fn=os.setsid)
+                    process_commit = head
+
+                time.sleep(1)
+
+        except KeyboardInterrupt:
+            self.output('')
+            self.output.info('Stopped watching')
+
+        finally:
+            if process is not None and process.poll() is None:
+                self._cancel_deploy_process(process, status_directory, checkpoints)
+
+        return True
+
+    def _cancel_deploy_process(self, process, status_directory, checkpoints):
+        """
+        Cancel a deploy running in another process
+        :param process:             The process
+        :param status_directory:    Directory the process keeps its status in
+        :param checkpoints:         Directory to keep the checkpoints in
+        :return:                    void
+        """
+
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except OSError:
+            pass
+        process.wait()
+
+        # A cancelled deploy won't be resumed
+        status = self._yaml_load(status_directory, 'status.yaml') if os.path.isfile(os.path.join(status_directory, 'status.yaml')) else None
+        if status and status.get('run_id') and checkpoints:
+            checkpoint_directory = os.path.join(checkpoints, status['run_id'])
+            if os.path.isdir(checkpoint_directory):
+                shutil.rmtree(checkpoint_directory)
+
+    def _select_project(self, name):
+        """
+        Select the project to deploy
+        :param name:    Name of the project
+        :return:        Success
+        """
+
+        for project in self.config('projects'):
+            if project['name'] == name:
+                self._project = project
+                # Projects share the caches, so keep those of different repositories apart
+                self._cache_namespace = hashlib.sha1(project['repository'].encode('utf-8')).hexdigest()[:12]
+                return True
+
+        self.output.error('Project \'%s\' is not set in deploy.yaml' % name)
+        return False
+
+    def _get_deploy_config(self, key, default=None):
+        """
+        Get deploy config, from the selected project when it sets it
+        :param key:     The key
+        :param default: Default value
+        :return:        Value
+        """
+
+        if self._project is not None:
+            value = self._project
+            for part in key.split('.'):
+                if not isinstance(value, dict) or part not in value:
+                    break
+                value = value[part]
+            else:
+                return value
+
+        return self.config('deploy.%s' % key, default)
+
+    def warm(self, arguments=None):
+        """
+        Warm the caches
+        :param arguments:   The arguments
+        :return:            void
+        """
+
+        try:
+            self._warm(arguments=arguments)
+            self.output('')
+        finally:
+            self._clean_up()
+
+    def _warm(self, arguments=None):
+        """
+        Actually warm the caches of each configured branch
+        :param arguments:   The arguments
+        :return:            Success
+        """
+
+        # Prepare
+        if not self._load_config():
+            return False
+
+        # Deploys can run meanwhile, but only one warm at a time
+        with self._cache.lock('warm', blocking=False) as locked:
+            if not locked:
+                self.output.info('Skipped warming, the caches are already being warmed')
+                return True
+
+            succeeded = True
+            for project in self.config('projects', None) or [None]:
+                if project is not None and not self._select_project(project['name']):
+                    return False
+                succeeded = self._warm_project() and succeeded
+
+            succeeded = self._upload_caches() and succeeded
+
+        if succeeded:
+            self.output.success('Successfully warmed the caches')
+        return succeeded
+
+    def _warm_project(self):
+        """
+        Warm the caches of each configured branch of the selected project
+        :return:    Success
+        """
+
+        name = self._get_deploy_config('name')
+        if not self._get_deploy_config('caching', True):
+            self.output.info('Skipped warming %s, caching is disabled' % name)
+            return True
+
+        # Config
+        repo = self._get_deploy_config('repository')
+        branch = self._get_deploy_config('branch', 'master')
+        environment = self._get_deploy_config('warm.environment', self.PRODUCTION)
+        lfs = self._get_deploy_config('lfs.enabled', False)
+        lfs_storage = self._get_deploy_config('lfs.storage', './lfs.cache')
+        composer_options = self._get_deploy_config('composer.%s' % environment, {})
+        npm_cache_directory = self._get_deploy_config('npm.cache', './npm.cache')
+        npm_ci = self._get_deploy_config('npm.ci', True)
+
+        # Warm the deploy branch last, so its dependencies end up in the caches
+        branches = [warm_branch for warm_branch in self._get_deploy_config('warm.branches', []) if warm_branch != branch]
+        branches.append(branch)
+
+        succeeded = True
+        for warm_branch in branches:
+            self.output.title('Warming caches of %s \'%s\'' % (name, warm_branch))
+            self.output('')
+
+            directory = self._get_temp_dir()
+
+            if not self._git_clone(environment, directory, repo, warm_branch, lfs=lfs) \
+                    or (lfs and not self._git_lfs_pull(environment, directory, lfs_storage)) \
+                    or not self._submodules_update(environment, directory) \
+                    or not self._composer_install(environment, directory, options=composer_options) \
+                    or not self._npm_install(environment, directory, cache_directory=npm_cache_directory, ci=npm_ci):
+                self.output.error('Failed warming caches of %s \'%s\'' % (name, warm_branch))
+                succeeded = False
+
+            self._clean_up()
+            self.output('')
+
+        return succeeded
+
+    def stats(self, arguments=None):
+        """
+        Show statistics of previous deploys
+        :param arguments:   The arguments
+        :return:            void
+        """
+
+        if not self._load_config():
+            return False
+
+        if self._deploy_history is None:
+            self.output.error('Deploy history is disabled in deploy.yaml')
+            return False
+
+        # Projects
+        project_name = self._get_argument(arguments, 'project')
+        if not self.config('projects', None):
+            self._output_stats()
+        elif project_name is not None:
+            if not self._select_project(project_name):
+                return False
+            self._output_stats(project_name)
+        else:
+            for project in self.config('projects'):
+                self._output_stats(project['name'])
+
+        return True
+
+    def _output_stats(self, project=None):
+        """
+        Output the statistics of previous deploys
+        :param project: Only deploys of this project
+        :return:        void
+        """
+
+        suffix = ' of %s' % project if project is not None else ''
+
+        # Stage durations
+        self.output.title('Stage durations%s' % suffix)
+        durations = self._deploy_history.get_stage_durations(project=project)
+        if not durations:
+            self.output.info('No deploys recorded yet')
+        for stage in sorted(durations):
+            stage_durations = sorted(durations[stage])
+            self.output('%-20s p50: %8.1fs   p95: %8.1fs   runs: %i' % (
+                stage, self._percentile(stage_durations, 50), self._percentile(stage_durations, 95), len(stage_durations)))
+        self.output('')
+
+        # Cache hit rates
+        self.output.title('Cache hit rates%s' % suffix)
+        hit_rates = self._deploy_history.get_cache_hit_rates(project=project)
+        if not hit_rates:
+            self.output.info('No cache usage recorded yet')
+        for week, cache, hits, total in hit_rates:
+            self.output('%-10s %-12s %5.1f%%   (%i/%i)' % (week, cache, 100.0 * hits / total, hits, total))
+        self.output('')
+
+        # Network
+        self.output.title('Network retries and timeouts%s' % suffix)
+        network_attempts = self._deploy_history.get_network_attempts(project=project)
+        if not network_attempts:
+            self.output.info('No retries or timeouts recorded yet')
+        for step, runs, retries, timeouts, hedges in network_attempts:
+            self.output('%-10s affected runs: %i   retries: %i   timeouts: %i   hedges: %i' % (step, runs, retries, timeouts, hedges))
+        self.output('')
+
+    def _percentile(self, values, percentile):
+        """
+        Nearest-rank percentile
+        :param values:      Sorted values
+        :param percentile:  The percentile
+        :return:            Value
+        """
+
+        index = max(0, int(-(-len(values) * percentile // 100)) - 1)
+        return values[index]
 
     def _load_config(self):
         """
@@ -164,6 +749,19 @@ class Gae(BaseDriver):
         if not self._validate_config():
             return False
 
+        # Load cache
+        if not self._set_cache(self.config('deploy.cache', {})):
+            return False
+
+        # Load timeouts and retries
+        if not self._set_network_config(self.config('deploy.network', {})):
+            return False
+
+        # Load deploy history
+        deploy_history = self.config('deploy.history', './deploy.history.db')
+        if deploy_history:
+            self._set_deploy_history(deploy_history)
+
         # Load slack integration
         slack_integration = self.config('notifications.slack', None)
         if slack_integration is not None:
@@ -172,6 +770,41 @@ class Gae(BaseDriver):
 
         return True
 
+    def _get_config_hash(self):
+        """
+        Get the hash of the config
+        :return:    Hash
+        """
+
+        deploy_yaml = open('deploy.yaml', 'rb')
+        try:
+            return hashlib.sha1(deploy_yaml.read()).hexdigest()
+        finally:
+            deploy_yaml.close()
+
+    def _check_resumed_commit(self, repo, branch):
+        """
+        Check the branch didn't move since the run that is being resumed
+        :param repo:    The link to the repo
+        :param branch:  The branch
+        :return:        Success
+        """
+
+        commit = self._checkpoint['commit']
+        if commit is None:
+            return True
+
+        remote_commit = self._get_remote_commit_hash(repo, branch)
+        if remote_commit is None:
+            self.output.error('Failed fetching the head of branch \'%s\'' % branch)
+            return False
+
+        if remote_commit != commit:
+            self.output.error('Branch \'%s\' has moved since run %s (%s != %s), start a new deploy' % (branch, self._checkpoint['run_id'], remote_commit, commit))
+            return False
+
+        return True
+
     def _validate_config(self):
         """
         Validate the config
@@ -180,6 +813,36 @@ class Gae(BaseDriver):
 
         valid_config = True
 
+        projects = self.config('projects', None)
+        if projects:
+            names = []
+            slugs = dict()
+            for index, project in enumerate(projects):
+                if not isinstance(project, dict) or not project.get('name'):
+                    self.output.error('\'projects > %i > name\' is not set in deploy.yaml' % index)
+                    valid_config = False
+                    continue
+                if not project.get('repository'):
+                    self.output.error('\'projects > %s > repository\' is not set in deploy.yaml' % project['name'])
+                    valid_config = False
+                if project['name'] in names:
+                    self.output.error('Project \'%s\' is set more than once in deploy.yaml' % project['name'])
+                    valid_config = False
+                    continue
+                names.append(project['name'])
+
+                # Its log and status files are named after it
+                slug = self._get_project_slug(project['name'])
+                if not slug:
+                    self.output.error('Project \'%s\' needs letters or digits in its name' % project['name'])
+                    valid_config = False
+                elif slug in slugs:
+                    self.output.error('Projects \'%s\' and \'%s\' are too similarly named' % (slugs[slug], project['name']))
+                    valid_config = False
+                else:
+                    slugs[slug] = project['name']
+            return valid_config
+
         if self.config('deploy.name') is None:
             self.output.error('\'deploy > name\' is not set in deploy.yaml')
             valid_config = False
@@ -197,7 +860,7 @@ class Gae(BaseDriver):
         :return:    Success
         """
 
-        persistent_files = self.config('deploy.persistent', {})
+        persistent_files = self._get_deploy_config('persistent', {})
         if not persistent_files:
             self.output.info('Skipped copying persistent files')
             return True
@@ -257,51 +920,65 @@ class Gae(BaseDriver):
         version_string_dot = '%i.%i.%i' % tuple(version)
 
         if environment == self.PRODUCTION:
-            # Increase app yaml version
-            command = 'sed -i.bak -e "s/^version[ \\t]*:[ \\t]*[0-9]*[^0-9\\n]*[0-9]*[^0-9\\n]*[0-9]*$/version: %s/" "%s/app.yaml"' % (version_string_underscore, directory)
-            command += ' && rm -f %s/app.yaml.bak' % directory
-            description = 'Increase version of app.yaml'
-            out, err, exitcode = self.execute.spinner(command, description)
-            if exitcode != 0:
-                self.output.error('Failed to increase version of app.yaml\n%s' % '\n'.join(err))
-                return False
+            # A resumed run may have committed the release before it failed
+            commit_hash = self._get_commit_hash(directory)
+            released = self._checkpoint is not None and self._checkpoint['commit'] is not None \
+                and commit_hash != self._checkpoint['commit']
 
-            # Add file to git
-            command = 'git --git-dir "%s/.git" --work-tree "%s" add app.yaml' % (directory, directory)
-            description = 'Adding the increased app.yaml to git'
-            out, err, exitcode = self.execute.spinner(command, description)
-            if exitcode != 0:
-                self.output.error('Failed adding the increased app.yaml to git\n%s' % '\n'.join(err))
-                return False
-
-            # Commit
             datetime_string = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
             user = self._get_current_user()
             commit_title = 'Release of %s on %s UTC by %s' % (branch, datetime_string, user.name)
-            commit_description = 'Released on Google App Engine application %s as version %s' % (app_yaml['application'], version_string_underscore)
-            command = 'git --git-dir "%s/.git" --work-tree "%s" commit -m "%s" -m "%s"' % (directory, directory, commit_title, commit_description)
-            description = 'Committing the increased app.yaml to git'
-            out, err, exitcode = self.execute.spinner(command, description)
-            if exitcode != 0:
-                self.output.error('Failed committing the increased app.yaml to git\n%s' % '\n'.join(err))
-                return False
 
-            # Last hash
-            command = 'git --git-dir "%s/.git" --work-tree "%s" rev-parse HEAD' % (directory, directory)
-            description = 'Fetching the hash of the last commit'
-            out, err, exitcode = self.execute.spinner(command, description)
-            if exitcode != 0:
-                self.output.error('Failed fetching the hash of the last commit\n%s' % '\n'.join(err))
-                return False
-            commit_hash = out[0]
+            if released:
+                self.output.info('Skipped committing the increased app.yaml, committed in run %s' % self._checkpoint['run_id'])
 
-            # Tag
-            command = 'git --git-dir "%s/.git" --work-tree "%s" tag -a v%s -m "Version %s (%s)" %s' % (directory, directory, version_string_dot, version_string_dot, commit_title, commit_hash)
-            description = 'Tagging the last commit as a new release'
-            out, err, exitcode = self.execute.spinner(command, description)
-            if exitcode != 0:
-                self.output.error('Failed tagging the last commit as a new release\n%s' % '\n'.join(err))
-                return False
+            else:
+                # Increase app yaml version
+                command = 'sed -i.bak -e "s/^version[ \\t]*:[ \\t]*[0-9]*[^0-9\\n]*[0-9]*[^0-9\\n]*[0-9]*$/version: %s/" "%s/app.yaml"' % (version_string_underscore, directory)
+                command += ' && rm -f %s/app.yaml.bak' % directory
+                description = 'Increase version of app.yaml'
+                out, err, exitcode = self.execute.spinner(command, description)
+                if exitcode != 0:
+                    self.output.error('Failed to increase version of app.yaml\n%s' % '\n'.join(err))
+                    return False
+
+                # Add file to git
+                command = 'git --git-dir "%s/.git" --work-tree "%s" add app.yaml' % (directory, directory)
+                description = 'Adding the increased app.yaml to git'
+                out, err, exitcode = self.execute.spinner(command, description)
+                if exitcode != 0:
+                    self.output.error('Failed adding the increased app.yaml to git\n%s' % '\n'.join(err))
+                    return False
+
+                # Commit
+                commit_description = 'Released on Google App Engine application %s as version %s' % (app_yaml['application'], version_string_underscore)
+                command = 'git --git-dir "%s/.git" --work-tree "%s" commit -m "%s" -m "%s"' % (directory, directory, commit_title, commit_description)
+                description = 'Committing the increased app.yaml to git'
+                out, err, exitcode = self.execute.spinner(command, description)
+                if exitcode != 0:
+                    self.output.error('Failed committing the increased app.yaml to git\n%s' % '\n'.join(err))
+                    return False
+
+                # Last hash
+                command = 'git --git-dir "%s/.git" --work-tree "%s" rev-parse HEAD' % (directory, directory)
+                description = 'Fetching the hash of the last commit'
+                out, err, exitcode = self.execute.spinner(command, description)
+                if exitcode != 0:
+                    self.output.error('Failed fetching the hash of the last commit\n%s' % '\n'.join(err))
+                    return False
+                commit_hash = out[0]
+
+            # Tag, unless a resumed run already did
+            out, err, exitcode = self.execute('git --git-dir "%s/.git" --work-tree "%s" rev-parse -q --verify "refs/tags/v%s^{commit}"' % (directory, directory, version_string_dot))
+            if released and exitcode == 0 and out and out[0] == commit_hash:
+                self.output.info('Skipped tagging the last commit, tagged in run %s' % self._checkpoint['run_id'])
+            else:
+                command = 'git --git-dir "%s/.git" --work-tree "%s" tag -a v%s -m "Version %s (%s)" %s' % (directory, directory, version_string_dot, version_string_dot, commit_title, commit_hash)
+                description = 'Tagging the last commit as a new release'
+                out, err, exitcode = self.execute.spinner(command, description)
+                if exitcode != 0:
+                    self.output.error('Failed tagging the last commit as a new release\n%s' % '\n'.join(err))
+                    return False
 
         else:
             # Set application name
@@ -348,7 +1025,10 @@ class Gae(BaseDriver):
         :return:            Success
         """
 
-        commands = self.config(key, [])
+        if self._project is not None and key in self._project:
+            commands = self._project[key] or []
+        else:
+            commands = self.config(key, [])
         if not commands:
             self.output.info('Skipped %s' % key)
             return True
@@ -378,7 +1058,17 @@ class Gae(BaseDriver):
 
         command = 'appcfg.py update "%s/."' % directory
         description = 'Deploying the app'
-        out, err, exitcode = self.execute.spinner(command, description)
+        # An interrupted update keeps the app locked until it's rolled back
+        rollback = 'appcfg.py rollback "%s/."' % directory
+        try:
+            out, err, exitcode = self._execute_network('deploy', command, description, before_retry=rollback)
+        except (KeyboardInterrupt, SystemExit):
+            self.execute(rollback)
+            raise
+        # Retries already rolled back the earlier attempts, not the last one
+        if exitcode == 124 or exitcode < 0:
+            self.output.info('Rolling back the interrupted update')
+            self.execute(rollback)
         if exitcode != 0:
             self.output.error('Failed deploying the app\n%s' % '\n'.join(err))
             return False
@@ -396,14 +1086,17 @@ class Gae(BaseDriver):
 
         command = 'git --git-dir "%s/.git" --work-tree "%s" pull --rebase' % (directory, directory)
         description = 'Pulling git repository before pushing'
-        out, err, exitcode = self.execute.spinner(command, description)
+        # A failed rebase leaves the repository mid-rebase
+        abort = 'git --git-dir "%s/.git" --work-tree "%s" rebase --abort' % (directory, directory)
+        out, err, exitcode = self._execute_network('git_push', command, description, before_retry=abort)
         if exitcode != 0:
+            self.execute(abort)
             self.output.error('Failed pulling git repository before pushing\n%s' % '\n'.join(err))
             return False
 
         command = 'git --git-dir "%s/.git" --work-tree "%s" push --follow-tags' % (directory, directory)
         description = 'Pushing new version to repository'
-        out, err, exitcode = self.execute.spinner(command, description)
+        out, err, exitcode = self._execute_network('git_push', command, description)
         if exitcode != 0:
             self.output.error('Failed pushing new version to repository\n%s' % '\n'.join(err))
             return False
@@ -0,0 +1,203 @@
+
+import sqlite3
+
+
+class DeployHistory(object):
+
+    def __init__(self, path):
+        """
+        Construct
+        :param path:    Path to the database
+        """
+
+        self.path = path
+
+    def _connect(self):
+        """
+        Connect to the database and make sure the tables exist
+        :return:    Connection
+        """
+
+        connection = sqlite3.connect(self.path)
+        connection.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at REAL NOT NULL,
+                duration REAL,
+                environment TEXT NOT NULL,
+                branch TEXT,
+                commit_hash TEXT,
+                user TEXT,
+                result TEXT NOT NULL,
+                failure_stage TEXT,
+                release_commit TEXT,
+                project TEXT
+            );
+            CREATE TABLE IF NOT EXISTS stage_durations (
+                run INTEGER NOT NULL REFERENCES runs (id),
+                stage TEXT NOT NULL,
+                duration REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cache_hits (
+                run INTEGER NOT NULL REFERENCES runs (id),
+                cache TEXT NOT NULL,
+                hit INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS network_attempts (
+                run INTEGER NOT NULL REFERENCES runs (id),
+                step TEXT NOT NULL,
+                retries INTEGER NOT NULL,
+                timeouts INTEGER NOT NULL,
+                hedges INTEGER NOT NULL
+            );
+        ''')
+
+        # Added later on
+        columns = [row[1] for row in connection.execute('PRAGMA table_info(runs)').fetchall()]
+        if 'release_commit' not in columns:
+            connection.execute('ALTER TABLE runs ADD COLUMN release_commit TEXT')
+        if 'project' not in columns:
+            connection.execute('ALTER TABLE runs ADD COLUMN project TEXT')
+
+        return connection
+
+    def save(self, deploy_run):
+        """
+        Save a deploy run
+        :param deploy_run:  The deploy run
+        :return:            Id of the run
+        """
+
+        connection = self._connect()
+        try:
+            with connection:
+                cursor = connection.execute(
+                    'INSERT INTO runs (started_at, duration, environment, branch, commit_hash, user, result, failure_stage, release_commit, project)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (deploy_run.started_at, deploy_run.duration, deploy_run.environment, deploy_run.branch,
+                     deploy_run.commit, deploy_run.user, deploy_run.result, deploy_run.failure_stage, deploy_run.release_commit,
+                     deploy_run.project))
+                run_id = cursor.lastrowid
+
+                connection.executemany(
+                    'INSERT INTO stage_durations (run, stage, duration) VALUES (?, ?, ?)',
+                    [(run_id, stage, duration) for stage, duration in deploy_run.stage_durations.items()])
+                connection.executemany(
+                    'INSERT INTO cache_hits (run, cache, hit) VALUES (?, ?, ?)',
+                    [(run_id, cache, 1 if hit else 0) for cache, hit in deploy_run.cache_hits.items()])
+                connection.executemany(
+                    'INSERT INTO network_attempts (run, step, retries, timeouts, hedges) VALUES (?, ?, ?, ?, ?)',
+                    [(run_id, step, attempts['retries'], attempts['timeouts'], attempts['hedges'])
+                     for step, attempts in deploy_run.network_attempts.items()])
+        finally:
+            connection.close()
+
+        return run_id
+
+    def get_stage_durations(self, environment=None, project=None):
+        """
+        Get the durations of each stage, including the total duration of succeeded runs
+        :param environment: Only runs of this environment
+        :param project:     Only runs of this project
+        :return:            Dict of stage to list of durations
+        """
+
+        conditions, parameters = self._get_conditions(environment, project)
+        query = 'SELECT stage_durations.stage, stage_durations.duration FROM stage_durations' \
+                ' JOIN runs ON runs.id = stage_durations.run'
+        total_query = 'SELECT \'total\', duration FROM runs WHERE runs.result = \'succeeded\' AND runs.duration IS NOT NULL'
+        if conditions:
+            query += ' WHERE %s' % ' AND '.join(conditions)
+            total_query += ' AND %s' % ' AND '.join(conditions)
+
+        durations = dict()
+        connection = self._connect()
+        try:
+            for stage, duration in connection.execute(query, parameters).fetchall():
+                durations.setdefault(stage, []).append(duration)
+            for stage, duration in connection.execute(total_query, parameters).fetchall():
+                durations.setdefault(stage, []).append(duration)
+        finally:
+            connection.close()
+
+        return durations
+
+    def get_cache_hit_rates(self, environment=None, project=None):
+        """
+        Get the cache hit rates per week
+        :param environment: Only runs of this environment
+        :param project:     Only runs of this project
+        :return:            List of (week, cache, hits, total)
+        """
+
+        conditions, parameters = self._get_conditions(environment, project)
+        query = 'SELECT strftime(\'%Y-W%W\', runs.started_at, \'unixepoch\') AS week, cache_hits.cache,' \
+                ' SUM(cache_hits.hit), COUNT(*) FROM cache_hits JOIN runs ON runs.id = cache_hits.run'
+        if conditions:
+            query += ' WHERE %s' % ' AND '.join(conditions)
+        query += ' GROUP BY week, cache_hits.cache ORDER BY week, cache_hits.cache'
+
+        connection = self._connect()
+        try:
+            return connection.execute(query, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def get_last_commit(self, environment, branch, project=None):
+        """
+        Get the commit of the last succeeded deploy, or the release commit it pushed on top of it
+        :param environment: The environment
+        :param branch:      The branch
+        :param project:     The project, or None when not deploying one of several
+        :return:            Commit hash
+        """
+
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                'SELECT COALESCE(release_commit, commit_hash) FROM runs WHERE environment = ? AND branch = ? AND project IS ?'
+                ' AND result = \'succeeded\' ORDER BY started_at DESC LIMIT 1', (environment, branch, project)).fetchone()
+        finally:
+            connection.close()
+
+        return row[0] if row is not None else None
+
+    def get_network_attempts(self, environment=None, project=None):
+        """
+        Get the retries, timeouts and hedges of each network-bound step
+        :param environment: Only runs of this environment
+        :param project:     Only runs of this project
+        :return:            List of (step, runs, retries, timeouts, hedges)
+        """
+
+        conditions, parameters = self._get_conditions(environment, project)
+        query = 'SELECT network_attempts.step, COUNT(*), SUM(network_attempts.retries), SUM(network_attempts.timeouts),' \
+                ' SUM(network_attempts.hedges) FROM network_attempts JOIN runs ON runs.id = network_attempts.run'
+        if conditions:
+            query += ' WHERE %s' % ' AND '.join(conditions)
+        query += ' GROUP BY network_attempts.step ORDER BY network_attempts.step'
+
+        connection = self._connect()
+        try:
+            return connection.execute(query, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def _get_conditions(self, environment, project):
+        """
+        Get the conditions to filter runs on
+        :param environment: Only runs of this environment
+        :param project:     Only runs of this project
+        :return:            List of conditions and their parameters
+        """
+
+        conditions = []
+        parameters = ()
+        if environment is not None:
+            conditions.append('runs.environment = ?')
+            parameters += (environment,)
+        if project is not None:
+            conditions.append('runs.project = ?')
+            parameters += (project,)
+
+        return conditions, parameters
@@ -0,0 +1,30 @@
+
+import time
+
+
+class DeployRun(object):
+
+    RESULT_SUCCEEDED = 'succeeded'
+    RESULT_FAILED = 'failed'
+
+    def __init__(self, environment, branch, user, project=None):
+        """
+        Construct
+        :param environment: The environment
+        :param branch:      The branch
+        :param user:        Name of the user
+        :param project:     Name of the project, when deploying one of several
+        """
+        self.environment = environment
+        self.branch = branch
+        self.user = user
+        self.project = project
+        self.commit = None
+        self.release_commit = None
+        self.result = None
+        self.failure_stage = None
+        self.started_at = time.time()
+        self.duration = None
+        self.stage_durations = dict()
+        self.cache_hits = dict()
+        self.network_attempts = dict()